@@ -1,11 +1,28 @@
 #The COPYRIGHT file at the top level of this repository contains the full
 #copyright notices and license terms.
 from trytond.pool import Pool
-from . import production
+from . import check, ir, product, production, stock, variance
 
 def register():
     Pool.register(
+        check.LotCostCheck,
+        ir.Cron,
+        product.Uom,
+        product.ProductCostPrice,
         production.BOM,
+        production.BOMInfrastructureRate,
         production.Production,
+        production.DoChunkedStart,
+        production.DoChunkedResult,
+        stock.Move,
+        stock.Lot,
+        stock.LotCostLine,
+        stock.Period,
+        stock.PeriodLotCost,
+        variance.Variance,
+        variance.VarianceContext,
         module='production_lot_cost', type_='model')
+    Pool.register(
+        production.DoChunked,
+        module='production_lot_cost', type_='wizard')
 
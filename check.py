@@ -0,0 +1,125 @@
+# The COPYRIGHT file at the top level of this repository contains the full
+# copyright notices and license terms.
+import logging
+
+from trytond.model import ModelSQL, ModelView, Workflow, fields
+from trytond.pool import Pool
+from trytond.pyson import Eval
+from trytond.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+
+class LotCostCheck(Workflow, ModelSQL, ModelView):
+    "Production Lot Cost Check"
+    __name__ = 'production.lot_cost.check'
+    repair = fields.Boolean("Repair",
+        states={
+            'readonly': Eval('state') != 'draft',
+            },
+        help="Replace the costs that do not match the recomputed ones.")
+    size = fields.Integer("Chunk Size", required=True,
+        domain=[('size', '>', 0)],
+        states={
+            'readonly': Eval('state') != 'draft',
+            },
+        help="The number of productions checked per transaction.")
+    last_production = fields.Many2One(
+        'production', "Last Production", readonly=True, ondelete='RESTRICT',
+        help="The production from which the scan resumes.")
+    productions = fields.Integer("Productions", readonly=True)
+    mismatches = fields.Integer("Mismatches", readonly=True)
+    report = fields.Text("Report", readonly=True)
+    state = fields.Selection([
+            ('draft', "Draft"),
+            ('running', "Running"),
+            ('done', "Done"),
+            ], "State", readonly=True, sort=False)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._order.insert(0, ('id', 'DESC'))
+        cls._transitions |= {
+            ('draft', 'running'),
+            }
+        cls._buttons.update({
+                'run': {
+                    'invisible': Eval('state') != 'draft',
+                    'depends': ['state'],
+                    },
+                })
+
+    @classmethod
+    def default_repair(cls):
+        return False
+
+    @classmethod
+    def default_size(cls):
+        return 100
+
+    @classmethod
+    def default_productions(cls):
+        return 0
+
+    @classmethod
+    def default_mismatches(cls):
+        return 0
+
+    @classmethod
+    def default_state(cls):
+        return 'draft'
+
+    @classmethod
+    @ModelView.button
+    @Workflow.transition('running')
+    def run(cls, checks):
+        with Transaction().set_context(queue_name='production'):
+            cls.__queue__.scan(checks)
+
+    @classmethod
+    def scan(cls, checks=None):
+        """Scan the done productions of the running checks by chunks
+
+        Each chunk is checked in its own transaction which also stores the
+        last production checked, so an interrupted scan resumes from it."""
+        if checks is None:
+            checks = cls.search([('state', '=', 'running')])
+        for check in checks:
+            while cls._scan_chunk(check.id):
+                pass
+
+    @classmethod
+    def _scan_chunk(cls, check_id):
+        "Check the next chunk of productions and return if the scan continues"
+        pool = Pool()
+        Production = pool.get('production')
+        transaction = Transaction()
+
+        with transaction.new_transaction() as chunk_transaction:
+            check = cls(check_id)
+            if check.state != 'running':
+                return False
+            domain = [('state', '=', 'done')]
+            if check.last_production:
+                domain.append(('id', '>', check.last_production.id))
+            productions = Production.search(
+                domain, order=[('id', 'ASC')], limit=check.size)
+            if not productions:
+                cls.write([check], {'state': 'done'})
+                return False
+
+            messages = Production.check_cost_consistency(productions)
+            for message in messages:
+                logger.warning(message)
+            if not check.repair:
+                chunk_transaction.rollback()
+                check = cls(check_id)
+            report = '\n'.join(filter(None, [check.report] + messages))
+            cls.write([check], {
+                    'last_production': productions[-1].id,
+                    'productions': check.productions + len(productions),
+                    'mismatches': check.mismatches + len(messages),
+                    'report': report or None,
+                    })
+            return True
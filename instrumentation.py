@@ -0,0 +1,116 @@
+# The COPYRIGHT file at the top level of this repository contains the full
+# copyright notices and license terms.
+import logging
+import time
+from functools import wraps
+
+from trytond.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Context key to enable the instrumentation.
+# If its value is a list, the statistics of each call are appended to it.
+CONTEXT_KEY = 'production_lot_cost_profile'
+
+
+class _CountingCursor:
+    "Cursor proxy that counts the executed queries and the fetched rows"
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._cursor.__exit__(*args)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats['rows'] += 1
+            yield row
+
+    def execute(self, *args, **kwargs):
+        self._stats['queries'] += 1
+        self._cursor.execute(*args, **kwargs)
+        return self
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats['rows'] += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats['rows'] += len(rows)
+        return rows
+
+
+def _count_queries(connection, stats):
+    "Wrap the cursor method of the connection and return the restore function"
+    previous = connection.__dict__.get('cursor')
+    cursor = connection.cursor
+
+    def counting_cursor(*args, **kwargs):
+        return _CountingCursor(cursor(*args, **kwargs), stats)
+    try:
+        connection.cursor = counting_cursor
+    except AttributeError:
+        # The connection does not allow to wrap its cursor
+        stats['queries'] = stats['rows'] = None
+        return lambda: None
+
+    def restore():
+        if previous is None:
+            del connection.cursor
+        else:
+            connection.cursor = previous
+    return restore
+
+
+def instrumented(func):
+    """Measure the calls of a classmethod on records
+
+    The number of queries, the fetched rows and the wall time are logged when
+    the logger is enabled for debug or, as info, when the
+    production_lot_cost_profile context key is set."""
+    @wraps(func)
+    def wrapper(cls, records, *args, **kwargs):
+        transaction = Transaction()
+        collector = transaction.context.get(CONTEXT_KEY)
+        enabled = collector is not None and collector is not False
+        if not enabled and not logger.isEnabledFor(logging.DEBUG):
+            return func(cls, records, *args, **kwargs)
+
+        stats = {'queries': 0, 'rows': 0}
+        restore = _count_queries(transaction.connection, stats)
+        start = time.perf_counter()
+        try:
+            return func(cls, records, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            restore()
+            count = len(records)
+            stats.update({
+                    'method': '%s.%s' % (cls.__name__, func.__name__),
+                    'records': count,
+                    'time': duration,
+                    'time_per_record': duration / count if count else None,
+                    })
+            logger.log(logging.INFO if enabled else logging.DEBUG,
+                "%(method)s: %(records)s records, %(queries)s queries, "
+                "%(rows)s rows, %(time).6fs", stats)
+            if isinstance(collector, list):
+                collector.append(stats)
+    return wrapper
@@ -0,0 +1,49 @@
+# The COPYRIGHT file at the top level of this repository contains the full
+# copyright notices and license terms.
+from trytond.pool import Pool, PoolMeta
+
+
+class Uom(metaclass=PoolMeta):
+    __name__ = 'product.uom'
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        Production = pool.get('production')
+        super().write(*args)
+        Production._uom_factor_cache.clear()
+        Production.clear_cost_memo()
+
+    @classmethod
+    def delete(cls, uoms):
+        pool = Pool()
+        Production = pool.get('production')
+        super().delete(uoms)
+        Production._uom_factor_cache.clear()
+        Production.clear_cost_memo()
+
+
+class ProductCostPrice(metaclass=PoolMeta):
+    __name__ = 'product.cost_price'
+
+    @classmethod
+    def create(cls, vlist):
+        pool = Pool()
+        Production = pool.get('production')
+        records = super().create(vlist)
+        Production.clear_cost_memo()
+        return records
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        Production = pool.get('production')
+        super().write(*args)
+        Production.clear_cost_memo()
+
+    @classmethod
+    def delete(cls, records):
+        pool = Pool()
+        Production = pool.get('production')
+        super().delete(records)
+        Production.clear_cost_memo()
@@ -1,8 +1,99 @@
 # The COPYRIGHT file at the top level of this repository contains the full
 # copyright notices and license terms.
+import csv
+import logging
+import uuid
+from collections import Counter, defaultdict
 from decimal import Decimal
-from trytond.model import fields
-from trytond.pool import PoolMeta
+from itertools import groupby
+from weakref import WeakKeyDictionary
+
+from sql import Cast, Column, Literal, Null, Window
+from sql.aggregate import Max, Min, Sum
+from sql.conditionals import Case, Coalesce
+from sql.functions import Round, RowNumber
+from sql.operators import Concat, Or
+
+from trytond import backend
+from trytond.cache import Cache
+from trytond.config import config
+from trytond.exceptions import UserError, UserWarning
+from trytond.i18n import gettext
+from trytond.model import Index, ModelSQL, ModelView, Workflow, fields
+from trytond.modules.product import price_digits, round_price
+from trytond.pool import Pool, PoolMeta
+from trytond.tools import grouped_slice
+from trytond.transaction import Transaction, without_check_access
+from trytond.wizard import Button, StateTransition, StateView, Wizard
+
+from .exceptions import AllocationError, UnevenCostWarning
+from .instrumentation import instrumented
+
+logger = logging.getLogger(__name__)
+# Currency rates per transaction
+_currency_rates = WeakKeyDictionary()
+# Computed production costs per transaction
+_costs = WeakKeyDictionary()
+
+
+class _CostMemoDataManager:
+    "Remove the memoized costs and rates when the transaction is rolled back"
+
+    def __eq__(self, other):
+        if not isinstance(other, _CostMemoDataManager):
+            return NotImplemented
+        return True
+
+    def abort(self, trans):
+        self._clear(trans)
+
+    def tpc_begin(self, trans):
+        pass
+
+    def commit(self, trans):
+        pass
+
+    def tpc_vote(self, trans):
+        pass
+
+    def tpc_finish(self, trans):
+        pass
+
+    def tpc_abort(self, trans):
+        self._clear(trans)
+
+    def _clear(self, trans):
+        _costs.pop(trans, None)
+        _currency_rates.pop(trans, None)
+
+
+def _id_ranges(ids):
+    """Yield slices of the ids as lists of ranges
+
+    The runs of consecutive ids are grouped in a range so the contiguous ids
+    take a single range whatever their number."""
+    ranges, params = [], 0
+    ids = sorted({i for i in ids if i is not None})
+    for _, run in groupby(enumerate(ids), lambda x: x[1] - x[0]):
+        run = [i for _, i in run]
+        if len(run) > 2:
+            ranges.append((run[0], run[-1]))
+            params += 3
+        else:
+            ranges.extend((i, i) for i in run)
+            params += len(run)
+        if params >= backend.MAX_QUERY_PARAMS - 3:
+            yield ranges
+            ranges, params = [], 0
+    if ranges:
+        yield ranges
+
+
+def _id_ranges_clause(column, ranges):
+    "Return the clause selecting the ranges of ids on the column"
+    singles = [s for s, e in ranges if s == e]
+    return Or([(column >= s) & (column <= e) for s, e in ranges if s != e]
+        + ([fields.SQL_OPERATORS['in'](column, singles)] if singles else []))
 
 
 class BOM(metaclass=PoolMeta):
@@ -10,37 +101,1377 @@ class BOM(metaclass=PoolMeta):
     infrastructure_cost = fields.Numeric('Infrastructure Cost',
         digits=(16, 4),
         help='Infrastructure cost per lot unit')
+    infrastructure_cost_batch = fields.Numeric(
+        'Infrastructure Cost per Batch', digits=(16, 4),
+        help='Infrastructure cost per production')
+    infrastructure_cost_hour = fields.Numeric(
+        'Infrastructure Cost per Hour', digits=(16, 4),
+        help='Infrastructure cost per hour of production duration')
+    cost_allocation = fields.Selection([
+            (None, "Production Default"),
+            ('quantity', "Quantity"),
+            ('weight', "Weight"),
+            ('list_price', "List Price"),
+            ], "Cost Allocation",
+        help="The key to allocate the production cost to all its outputs.\n"
+        "Leave empty to use the allocation of the production module.")
+    infrastructure_rates = fields.One2Many(
+        'production.bom.infrastructure_rate', 'bom', "Infrastructure Rates",
+        help="The infrastructure costs per company and currency.\n"
+        "They replace the costs above for their company.")
+    _infrastructure_cost_cache = Cache(
+        'production.bom.infrastructure_cost', context=False)
+    # Hits and misses of the infrastructure cost cache in this process
+    infrastructure_cost_cache_stats = Counter()
+
+    @classmethod
+    def _infrastructure_cost_fields(cls):
+        "Return the fields of the infrastructure cost drivers"
+        return ['infrastructure_cost', 'infrastructure_cost_batch',
+            'infrastructure_cost_hour']
+
+    @classmethod
+    @instrumented
+    def get_infrastructure_cost_drivers(cls, boms):
+        "Return the infrastructure cost drivers per BOM id"
+        fnames = cls._infrastructure_cost_fields()
+        drivers, missing = {}, []
+        for bom in boms:
+            values = cls._infrastructure_cost_cache.get(bom.id)
+            if values is None:
+                missing.append(bom.id)
+            else:
+                drivers[bom.id] = values
+        cls.infrastructure_cost_cache_stats.update(
+            hit=len(drivers), miss=len(missing))
+        for bom in cls.read(missing, fnames):
+            values = {f: bom[f] or Decimal(0) for f in fnames}
+            drivers[bom['id']] = values
+            cls._infrastructure_cost_cache.set(bom['id'], values)
+        return drivers
+
+    @classmethod
+    def get_infrastructure_costs(cls, boms):
+        "Return the infrastructure cost per BOM id"
+        return {i: d['infrastructure_cost']
+            for i, d in cls.get_infrastructure_cost_drivers(boms).items()}
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        Production = pool.get('production')
+        actions = iter(args)
+        to_update = []
+        for boms, values in zip(actions, actions):
+            if values.keys() & (
+                    set(cls._infrastructure_cost_fields())
+                    | {'cost_allocation'}):
+                to_update.extend(boms)
+        super().write(*args)
+        cls._infrastructure_cost_cache.clear()
+        Production.clear_cost_memo()
+        cls.recompute_productions(to_update)
+
+    @classmethod
+    def recompute_productions(cls, boms, domain=None):
+        "Queue the recomputation of the lot costs of the BOM productions"
+        pool = Pool()
+        Production = pool.get('production')
+        if not boms:
+            return
+        # The productions of all the companies use the BOM
+        with without_check_access():
+            productions = Production.search([
+                    ('bom', 'in', [b.id for b in boms]),
+                    domain or [],
+                    ], order=[('id', 'ASC')])
+        # Push one task per batch of productions to not lock them all
+        with Transaction().set_context(
+                queue_name='production', queue_batch=True):
+            Production.__queue__.recompute_lot_costs(productions)
+
+    @classmethod
+    def delete(cls, boms):
+        pool = Pool()
+        Production = pool.get('production')
+        super().delete(boms)
+        cls._infrastructure_cost_cache.clear()
+        Production.clear_cost_memo()
+
+
+class BOMInfrastructureRate(ModelSQL, ModelView):
+    "BOM Infrastructure Rate"
+    __name__ = 'production.bom.infrastructure_rate'
+    bom = fields.Many2One(
+        'production.bom', "BOM", required=True, ondelete='CASCADE')
+    company = fields.Many2One('company.company', "Company", required=True)
+    currency = fields.Many2One('currency.currency', "Currency", required=True)
+    start_date = fields.Date("Start Date",
+        help="The date from which the rate applies.\n"
+        "Leave empty to apply it since the beginning.")
+    infrastructure_cost = fields.Numeric(
+        "Infrastructure Cost", digits=(16, 4),
+        help="Infrastructure cost per lot unit")
+    infrastructure_cost_batch = fields.Numeric(
+        "Infrastructure Cost per Batch", digits=(16, 4),
+        help="Infrastructure cost per production")
+    infrastructure_cost_hour = fields.Numeric(
+        "Infrastructure Cost per Hour", digits=(16, 4),
+        help="Infrastructure cost per hour of production duration")
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._order.insert(0, ('start_date', 'DESC NULLS LAST'))
+        t = cls.__table__()
+        cls._sql_indexes.add(Index(
+                t,
+                (t.bom, Index.Equality()),
+                (t.company, Index.Equality()),
+                (t.start_date, Index.Range(order='DESC NULLS LAST'))))
+
+    @classmethod
+    def default_company(cls):
+        return Transaction().context.get('company')
+
+    @fields.depends('company')
+    def on_change_company(self):
+        if self.company:
+            self.currency = self.company.currency
+
+    @classmethod
+    def create(cls, vlist):
+        rates = super().create(vlist)
+        cls._recompute_productions(cls._get_company_boms(rates))
+        return rates
+
+    @classmethod
+    def write(cls, *args):
+        rates = sum(args[::2], [])
+        company_boms = cls._get_company_boms(rates)
+        super().write(*args)
+        for company, boms in cls._get_company_boms(
+                cls.browse(rates)).items():
+            company_boms[company] |= boms
+        cls._recompute_productions(company_boms)
+
+    @classmethod
+    def delete(cls, rates):
+        company_boms = cls._get_company_boms(rates)
+        super().delete(rates)
+        cls._recompute_productions(company_boms)
+
+    @staticmethod
+    def _get_company_boms(rates):
+        "Return the BOMs of the rates per company and start date"
+        company_boms = defaultdict(set)
+        for rate in rates:
+            company_boms[rate.company.id, rate.start_date].add(rate.bom)
+        return company_boms
+
+    @classmethod
+    def _recompute_productions(cls, company_boms):
+        "Queue the recomputation of the productions dated from the rates"
+        pool = Pool()
+        BOM = pool.get('production.bom')
+        Production = pool.get('production')
+        Production.clear_cost_memo()
+        for (company, start_date), boms in company_boms.items():
+            domain = [('company', '=', company)]
+            if start_date:
+                domain.append(['OR',
+                        ('effective_date', '>=', start_date),
+                        ('effective_date', '=', None),
+                        ])
+            BOM.recompute_productions(list(boms), domain)
 
 
 class Production(metaclass=PoolMeta):
     __name__ = 'production'
+    _uom_factor_cache = Cache('production.uom_factor', context=False)
+    # Hits and misses of the cost memo in this process
+    cost_memo_stats = Counter()
+    duration = fields.TimeDelta('Duration',
+        help='The time the production takes.\n'
+        'Used to compute the infrastructure cost per hour.')
+    stored_cost = fields.Numeric('Stored Cost', digits=price_digits,
+        readonly=True,
+        help='The cost stored to search and order productions by cost.')
+    expected_lot_unit_cost = fields.Function(fields.Numeric(
+            "Expected Lot Unit Cost", digits=price_digits,
+            help="The projected cost per unit of product of the output lots."),
+        'get_expected_lot_unit_cost')
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.add(Index(t, (t.stored_cost, Index.Range())))
+        cls.cost.searcher = 'search_cost'
+
+    @classmethod
+    def __register__(cls, module_name):
+        table_h = cls.__table_handler__(module_name)
+        fill_stored_cost = not table_h.column_exist('stored_cost')
+
+        super().__register__(module_name)
+
+        if fill_stored_cost:
+            cls._fill_stored_cost()
+
+    @classmethod
+    def _fill_stored_cost(cls):
+        """Fill the stored cost with SQL by ranges of ids
+
+        The rates, the per batch and per hour costs are created with the
+        stored cost so only the infrastructure cost per unit of the BOM is
+        used."""
+        pool = Pool()
+        BOM = pool.get('production.bom')
+        CostPrice = pool.get('product.cost_price')
+        Move = pool.get('stock.move')
+        table = cls.__table__()
+        production = cls.__table__()
+        bom = BOM.__table__()
+        cost_price = CostPrice.__table__()
+        move = Move.__table__()
+        cursor = Transaction().connection.cursor()
+
+        quantity = Cast(move.internal_quantity, 'NUMERIC')
+        inputs_cost = (move
+            .join(cost_price, 'LEFT',
+                condition=(cost_price.product == move.product)
+                & (cost_price.company == move.company))
+            .select(
+                Sum(quantity * Coalesce(
+                        move.cost_price, cost_price.cost_price, 0)),
+                where=(move.production_input == table.id)
+                & (move.state != 'cancelled')))
+        infrastructure_cost = (move
+            .join(production,
+                condition=move.production_output == production.id)
+            .join(bom, condition=production.bom == bom.id)
+            .select(
+                Sum(quantity * Coalesce(bom.infrastructure_cost, 0)),
+                where=(move.production_output == table.id)
+                & (move.lot != Null)
+                & (move.state != 'cancelled')
+                & (move.product == production.product)))
+        cost = Round(
+            Coalesce(inputs_cost, 0) + Coalesce(infrastructure_cost, 0),
+            price_digits[1])
+        cursor.execute(*table.select(Min(table.id), Max(table.id)))
+        min_id, max_id = cursor.fetchone()
+        if min_id is None:
+            return
+        # Update by ranges of ids to not update the whole table at once
+        size = backend.MAX_QUERY_PARAMS
+        for start in range(min_id, max_id + 1, size):
+            cursor.execute(*table.update(
+                    [table.stored_cost], [cost],
+                    where=(table.id >= start) & (table.id < start + size)))
+
+    @classmethod
+    def default_stored_cost(cls):
+        return Decimal(0)
+
+    @classmethod
+    def search_cost(cls, name, clause):
+        return [('stored_cost',) + tuple(clause[1:])]
+
+    @classmethod
+    def order_cost(cls, tables):
+        table, _ = tables[None]
+        return [table.stored_cost]
+
+    @classmethod
+    @without_check_access
+    def _write_stored_cost(cls, costs):
+        "Write the stored cost per production id"
+        ids = defaultdict(list)
+        for id_, cost in costs.items():
+            ids[cost].append(id_)
+        to_write = []
+        for cost, p_ids in ids.items():
+            to_write.extend((cls.browse(p_ids), {'stored_cost': cost}))
+        if to_write:
+            cls.write(*to_write)
+
+    @classmethod
+    @instrumented
+    def set_stored_cost(cls, productions):
+        "Update the stored cost of the productions"
+        if not productions:
+            return
+        cls._write_stored_cost(cls.get_cost(productions, 'cost'))
+
+    @classmethod
+    @instrumented
+    def apply_output_changes(cls, productions, deltas, outputs):
+        """Update the costs of the productions for the changed outputs
+
+        deltas is the change of the lot output quantity per production id.
+        Only the infrastructure cost of the delta is added to the stored cost
+        and only the lot cost lines of the changed outputs are replaced when
+        the unit cost of the other outputs does not change."""
+        productions = [p for p in productions
+            if deltas.get(p.id) or p.state == 'done']
+        if not productions:
+            return
+        quantities = cls._get_lot_output_quantities(productions)
+        drivers = cls.get_infrastructure_cost_drivers(
+            [p for p in productions if p.bom])
+        costs, to_recompute, to_reline, to_update = {}, [], [], []
+        for production in productions:
+            delta = deltas.get(production.id, 0)
+            quantity = quantities.get(production.id, Decimal(0))
+            if delta and (production.stored_cost is None
+                    # The fixed costs apply only with lot outputs
+                    or not quantity or quantity == delta):
+                to_recompute.append(production)
+                if production.state == 'done':
+                    to_reline.append(production)
+                continue
+            if delta:
+                driver = drivers[production.id]
+                costs[production.id] = (production.stored_cost
+                    + delta * driver['infrastructure_cost'])
+            if production.state != 'done':
+                continue
+            if delta and (production.bom.cost_allocation
+                    or driver['infrastructure_cost_batch']
+                    or (production.duration
+                        and driver['infrastructure_cost_hour'])):
+                # The unit cost of all the outputs changes
+                to_reline.append(production)
+            else:
+                to_update.append(production)
+
+        cls._write_stored_cost(costs)
+        cls.set_stored_cost(to_recompute)
+        if to_reline:
+            cls.set_lot_cost_lines(to_reline)
+        if to_update:
+            cls.set_lot_cost_lines(to_update, [o for o in outputs
+                    if o.production_output in to_update])
+
+    @classmethod
+    @instrumented
+    def recompute_lot_costs(cls, productions):
+        """Recompute the costs of the productions and of their output lots
+        and propagate them to the productions that consume those lots"""
+        logger.info('Recompute lot costs of %d productions: %s',
+            len(productions), ', '.join(str(p.id) for p in productions))
+        cls._recompute_lot_costs(productions)
+        cls.propagate_lot_costs(list({o.lot for p in productions
+                    if p.state == 'done'
+                    for o in p.outputs if o.lot}))
+
+    @classmethod
+    def _recompute_lot_costs(cls, productions):
+        cls.set_stored_cost(productions)
+        productions = [p for p in productions
+            if p.state in {'running', 'done'}]
+        cls.set_cost(productions)
+        cls.set_lot_cost_lines(productions)
+
+    @classmethod
+    @instrumented
+    def check_cost_consistency(cls, productions):
+        """Recompute the costs of the done productions and return the messages
+        of the outputs with a unit price or lot costs that changed
+
+        The recomputed costs are kept in the transaction."""
+        pool = Pool()
+        Move = pool.get('stock.move')
+        Lot = pool.get('stock.lot')
+
+        productions = [p for p in productions if p.state == 'done']
+        before = cls._get_lot_cost_state(productions)
+        with Transaction().set_context(_skip_warnings=True):
+            cls._recompute_lot_costs(productions)
+        after = cls._get_lot_cost_state(cls.browse(productions))
+
+        messages = []
+        for output_id, state in before.items():
+            expected = after.get(output_id)
+            if expected is None or state == expected:
+                continue
+            unit_price, lot_id, lines = state
+            messages.append(gettext('production_lot_cost.msg_uneven_costs',
+                    move=Move(output_id).rec_name,
+                    move_unit_price=sum(p for _, p in expected[2]),
+                    lot=Lot(lot_id).rec_name,
+                    lot_unit_price=sum(p for _, p in lines)))
+        return messages
+
+    @classmethod
+    def _get_lot_cost_state(cls, productions):
+        """Return the unit price, the lot and the cost lines of the lot of the
+        done lot outputs per move id"""
+        outputs = [o for p in productions for o in p.outputs
+            if o.lot and o.state == 'done']
+        lines = defaultdict(list)
+        for line in cls._search_lot_cost_lines(outputs):
+            key = (line.origin.production_output.id, line.lot.id)
+            lines[key].append((line.category.id, line.unit_price))
+        return {o.id: (o.unit_price, o.lot.id,
+                sorted(lines[o.production_output.id, o.lot.id]))
+            for o in outputs}
+
+    @classmethod
+    def _get_lot_graph(cls, lots):
+        """Return the productions consuming the lots or their descendants
+        with their input and output lot ids"""
+        pool = Pool()
+        Move = pool.get('stock.move')
+        move = Move.__table__()
+        cursor = Transaction().connection.cursor()
+
+        inputs, outputs = defaultdict(set), defaultdict(set)
+        lot_ids = {l.id for l in lots}
+        frontier = set(lot_ids)
+        while frontier:
+            productions = set()
+            for sub_lot_ids in grouped_slice(
+                    list(frontier), backend.MAX_QUERY_PARAMS):
+                cursor.execute(*move.select(move.production_input, move.lot,
+                        where=fields.SQL_OPERATORS['in'](
+                            move.lot, list(sub_lot_ids))
+                        & (move.production_input != Null)
+                        & (move.state != 'cancelled')))
+                for production_id, lot_id in cursor:
+                    if production_id not in inputs:
+                        productions.add(production_id)
+                    inputs[production_id].add(lot_id)
+            frontier = set()
+            for sub_ids in grouped_slice(
+                    list(productions), backend.MAX_QUERY_PARAMS):
+                cursor.execute(*move.select(move.production_output, move.lot,
+                        where=fields.SQL_OPERATORS['in'](
+                            move.production_output, list(sub_ids))
+                        & (move.lot != Null)
+                        & (move.state != 'cancelled')))
+                for production_id, lot_id in cursor:
+                    outputs[production_id].add(lot_id)
+                    if lot_id not in lot_ids:
+                        lot_ids.add(lot_id)
+                        frontier.add(lot_id)
+        return inputs, outputs
+
+    @staticmethod
+    def _sort_lot_graph(inputs, outputs):
+        "Return the productions of the graph grouped in topological levels"
+        producers = defaultdict(set)
+        for production_id, lot_ids in outputs.items():
+            for lot_id in lot_ids:
+                producers[lot_id].add(production_id)
+        predecessors = {p: {q for l in lot_ids for q in producers[l]
+                if q in inputs and q != p}
+            for p, lot_ids in inputs.items()}
+        levels, done = [], set()
+        while len(done) < len(predecessors):
+            level = [p for p, q in predecessors.items()
+                if p not in done and q <= done]
+            if not level:
+                # Cycle between lots, revalue the remaining at once
+                level = [p for p in predecessors if p not in done]
+            levels.append(level)
+            done.update(level)
+        return levels
+
+    @classmethod
+    def _get_lot_cost_prices(cls, lot_ids):
+        "Return the cost price per lot id from the cost lines"
+        pool = Pool()
+        LotCostLine = pool.get('stock.lot.cost_line')
+        line = LotCostLine.__table__()
+        cursor = Transaction().connection.cursor()
+
+        prices = {}
+        for sub_lot_ids in grouped_slice(lot_ids, backend.MAX_QUERY_PARAMS):
+            cursor.execute(*line.select(line.lot, Sum(line.unit_price),
+                    where=fields.SQL_OPERATORS['in'](line.lot, sub_lot_ids),
+                    group_by=[line.lot]))
+            # SQLite returns float for numeric values
+            prices.update(
+                (l, round_price(Decimal(str(p)))) for l, p in cursor)
+        return prices
+
+    @classmethod
+    @instrumented
+    def propagate_lot_costs(cls, lots):
+        """Revalue in topological order the productions that consume the lots
+        directly or through other productions"""
+        pool = Pool()
+        Move = pool.get('stock.move')
+
+        inputs, outputs = cls._get_lot_graph(lots)
+        # Memoised lot cost prices, invalidated when the lot is revalued
+        lot_prices = {}
+        for level in cls._sort_lot_graph(inputs, outputs):
+            productions = cls.browse(level)
+            missing = {l for p in level for l in inputs[p]} - lot_prices.keys()
+            lot_prices.update(cls._get_lot_cost_prices(list(missing)))
+            moves = []
+            for production in productions:
+                for input_ in production.inputs:
+                    if (input_.lot and input_.state != 'cancelled'
+                            and input_.lot.id in lot_prices):
+                        cost_price = lot_prices[input_.lot.id]
+                        if input_.cost_price != cost_price:
+                            input_.cost_price = cost_price
+                            moves.append(input_)
+            Move.save(moves)
+            cls._recompute_lot_costs(productions)
+            for production_id in level:
+                for lot_id in outputs[production_id]:
+                    lot_prices.pop(lot_id, None)
+
+    @classmethod
+    def write(cls, *args):
+        actions = iter(args)
+        to_update, to_clear = [], []
+        for productions, values in zip(actions, actions):
+            if values.keys() & {
+                    'bom', 'product', 'duration', 'company',
+                    'effective_date', 'planned_date'}:
+                to_update.extend(productions)
+            if values.keys() - {'stored_cost'}:
+                to_clear.extend(productions)
+        super().write(*args)
+        cls.clear_cost_memo(to_clear)
+        to_update = cls.browse(to_update)
+        cls.set_stored_cost([p for p in to_update if p.state != 'done'])
+        cls._recompute_lot_costs([p for p in to_update if p.state == 'done'])
+
+    @classmethod
+    def delete(cls, productions):
+        super().delete(productions)
+        cls.clear_cost_memo(productions)
 
     @property
     def infrastructure_cost(self):
-        if self.product and self.bom and self.bom.infrastructure_cost:
-            return self.bom.infrastructure_cost
+        pool = Pool()
+        BOM = pool.get('production.bom')
+        if self.product and self.bom:
+            return BOM.get_infrastructure_costs([self.bom])[self.bom.id]
 
     @property
     def output_qty(self):
-        quantity = 0.
-        for output in self.outputs:
-            if output.product == self.product:
-                qty = output.quantity
-                if self.uom != output.uom:
-                    qty = self.uom.compute_qty(output.uom, output.quantity,
-                        self.uom, round=False)
+        "The quantity of product produced in the unit of the production"
+        if self.id is None or self.id < 0 or self._values:
+            # Sum the outputs in memory as they may not be saved
+            quantity = Decimal(0)
+            for output in self.outputs:
+                if (output.product != self.product
+                        or output.quantity is None
+                        or not output.unit or not self.unit):
+                    continue
+                qty = Decimal(str(output.quantity))
+                if output.unit != self.unit:
+                    qty *= self._get_uom_factor(output.unit, self.unit)
                 quantity += qty
+        else:
+            quantity = self.get_output_quantities([self])[self.id]
+        return float(quantity)
 
-        return quantity
+    @classmethod
+    @instrumented
+    def get_output_quantities(cls, productions):
+        "Return the quantity of product produced per production id"
+        pool = Pool()
+        Move = pool.get('stock.move')
+        Uom = pool.get('product.uom')
+        production = cls.__table__()
+        move = Move.__table__()
+        cursor = Transaction().connection.cursor()
 
-    def get_cost(self, name):
-        cost = super(Production, self).get_cost(name)
-        if not self.infrastructure_cost:
-            return cost
-        for output in self.outputs:
-            if not output.lot:
-                continue
-            if output.product == self.product:
-                cost += (Decimal(str(output.internal_quantity)) *
-                    self.infrastructure_cost)
+        quantities = {p.id: Decimal(0) for p in productions}
+        units = {p.id: p.unit for p in productions}
+        query = move.join(production,
+            condition=move.production_output == production.id)
+        for ranges in _id_ranges(quantities):
+            cursor.execute(*query.select(
+                    production.id, move.unit,
+                    Sum(Cast(move.quantity, 'NUMERIC')),
+                    where=(_id_ranges_clause(production.id, ranges)
+                        & (move.product == production.product)),
+                    group_by=[production.id, move.unit]))
+            for production_id, unit_id, quantity in cursor:
+                # SQLite returns float for numeric values
+                quantity = Decimal(str(quantity or 0))
+                unit = units[production_id]
+                if unit and unit.id != unit_id:
+                    quantity *= cls._get_uom_factor(Uom(unit_id), unit)
+                quantities[production_id] += quantity
+        return quantities
+
+    @classmethod
+    def _get_uom_factor(cls, from_uom, to_uom):
+        "Return the exact factor to convert quantities between the units"
+        key = (from_uom.id, to_uom.id)
+        factor = cls._uom_factor_cache.get(key)
+        if factor is not None:
+            return factor
+        if from_uom.category != to_uom.category:
+            raise ValueError("cannot convert between %s and %s"
+                % (from_uom.category.name, to_uom.category.name))
+        if from_uom.accurate_field == 'factor':
+            factor = Decimal(str(from_uom.factor))
+        else:
+            factor = 1 / Decimal(str(from_uom.rate))
+        if to_uom.accurate_field == 'factor':
+            factor /= Decimal(str(to_uom.factor))
+        else:
+            factor *= Decimal(str(to_uom.rate))
+        cls._uom_factor_cache.set(key, factor)
+        return factor
+
+    @classmethod
+    @instrumented
+    def get_cost(cls, productions, name):
+        """Return the cost per production id
+
+        The costs are memoized for the transaction until the productions,
+        their moves, their BOM or the lot costs are modified or the
+        transaction is rolled back."""
+        memo = cls._get_cost_memo()
+        costs, missing = {}, []
+        for production in productions:
+            if production.id in memo:
+                costs[production.id] = memo[production.id]
+            else:
+                missing.append(production)
+        cls.cost_memo_stats.update(hit=len(costs), miss=len(missing))
+        if not missing:
+            return costs
+        computed = cls._get_inputs_costs(missing, name)
+        for production_id, cost in cls._get_infrastructure_costs(
+                missing).items():
+            computed[production_id] += cost
+        costs.update(computed)
+        # Unsaved productions are not memoized
+        memo.update(
+            (i, c) for i, c in computed.items() if i is not None and i >= 0)
+        return costs
+
+    @classmethod
+    def _get_cost_memo(cls):
+        "Return the memoized costs of the transaction and context company"
+        transaction = Transaction()
+        transaction.join(_CostMemoDataManager())
+        memo = _costs.setdefault(transaction, {})
+        return memo.setdefault(transaction.context.get('company'), {})
+
+    @classmethod
+    def clear_cost_memo(cls, productions=None):
+        """Remove the memoized costs of the productions
+
+        If productions is None, all the costs of the transaction are
+        removed."""
+        transaction = Transaction()
+        if productions is None:
+            _costs.pop(transaction, None)
+            return
+        ids = {int(p) for p in productions}
+        for memo in _costs.get(transaction, {}).values():
+            for production_id in ids:
+                memo.pop(production_id, None)
+
+    @classmethod
+    @instrumented
+    def _get_inputs_costs(cls, productions, name):
+        "Return the cost computed by the production module per production"
+        get_cost = super().get_cost
+        return {p.id: get_cost(p, name) for p in productions}
+
+    @classmethod
+    @instrumented
+    def _get_lot_output_quantities(cls, productions):
+        "Return the internal quantity of lot outputs of the product"
+        pool = Pool()
+        Move = pool.get('stock.move')
+        production = cls.__table__()
+        move = Move.__table__()
+        cursor = Transaction().connection.cursor()
+
+        # Sum as numeric to get the same result than adding each quantity
+        total_quantity = Sum(Cast(move.internal_quantity, 'NUMERIC'))
+        query = move.join(production,
+            condition=move.production_output == production.id)
+        quantities = {}
+        for ranges in _id_ranges(p.id for p in productions):
+            cursor.execute(*query.select(
+                    production.id, total_quantity,
+                    where=(_id_ranges_clause(production.id, ranges)
+                        & (move.lot != Null)
+                        & (move.state != 'cancelled')
+                        & (move.product == production.product)
+                        & (production.bom != Null)),
+                    group_by=[production.id]))
+            # SQLite returns float for numeric values
+            quantities.update(
+                (p, Decimal(str(q))) for p, q in cursor if q)
+        return quantities
+
+    @classmethod
+    @instrumented
+    def _get_infrastructure_costs(cls, productions):
+        "Return the infrastructure cost of the lot outputs per production"
+        quantities = cls._get_lot_output_quantities(productions)
+        productions = [p for p in productions if p.id in quantities]
+        drivers = cls.get_infrastructure_cost_drivers(productions)
+        costs = {}
+        for production in productions:
+            cost = production._compute_infrastructure_cost(
+                quantities[production.id], drivers[production.id])
+            if cost:
+                costs[production.id] = cost
+        return costs
+
+    @classmethod
+    @instrumented
+    def get_infrastructure_cost_drivers(cls, productions):
+        """Return the infrastructure cost drivers in the company currency per
+        production id
+
+        The rate of the BOM for the company of the production applicable at
+        its date is used if any, otherwise the costs of the BOM are taken in
+        company currency."""
+        pool = Pool()
+        BOM = pool.get('production.bom')
+
+        drivers = BOM.get_infrastructure_cost_drivers(
+            {p.bom for p in productions})
+        rates = cls._get_infrastructure_rates(productions)
+        result = {}
+        for production in productions:
+            if production.id in rates:
+                currency_id, values = rates[production.id]
+                company = production.company
+                rate = cls._get_currency_rate(
+                    currency_id, company.currency.id,
+                    production._get_infrastructure_cost_date())
+                result[production.id] = {
+                    f: v * rate for f, v in values.items()}
+            else:
+                result[production.id] = drivers[production.bom.id]
+        return result
+
+    @classmethod
+    def _get_infrastructure_rates(cls, productions):
+        """Return the currency id and the cost drivers of the BOM rate
+        applicable per production id"""
+        pool = Pool()
+        BOM = pool.get('production.bom')
+        cursor = Transaction().connection.cursor()
+
+        fnames = BOM._infrastructure_cost_fields()
+        rates = {}
+        for ranges in _id_ranges(p.id for p in productions):
+            query = cls._infrastructure_rates_query(
+                lambda production: _id_ranges_clause(production.id, ranges))
+            cursor.execute(*query.select(
+                    query.production, query.currency,
+                    *(Column(query, f) for f in fnames)))
+            for production_id, currency_id, *values in cursor:
+                # SQLite returns float for numeric values
+                rates[production_id] = (currency_id, {
+                        f: Decimal(str(v)) if v is not None else Decimal(0)
+                        for f, v in zip(fnames, values)})
+        return rates
+
+    @classmethod
+    def _infrastructure_rates_query(cls, where=None):
+        """Return a SQL query with the production, the date, the currency and
+        the cost drivers of the BOM rate applicable to the productions
+
+        where is a function returning the clause on the production table."""
+        pool = Pool()
+        BOM = pool.get('production.bom')
+        Date = pool.get('ir.date')
+        Rate = pool.get('production.bom.infrastructure_rate')
+        production = cls.__table__()
+        rate = Rate.__table__()
+
+        fnames = BOM._infrastructure_cost_fields()
+        date = Coalesce(
+            production.effective_date, production.planned_date, Date.today())
+        # Rank the rates of each production from the most recent
+        number = RowNumber(window=Window([production.id],
+                order_by=[rate.start_date.desc.nulls_last, rate.id.desc]))
+        ranked = (production
+            .join(rate,
+                condition=(rate.bom == production.bom)
+                & (rate.company == production.company)
+                & ((rate.start_date == Null) | (rate.start_date <= date)))
+            .select(
+                production.id.as_('production'),
+                date.as_('date'),
+                rate.currency.as_('currency'),
+                *(Column(rate, f).as_(f) for f in fnames),
+                number.as_('number'),
+                where=where(production) if where else Literal(True)))
+        return ranked.select(
+            ranked.production, ranked.date, ranked.currency,
+            *(Column(ranked, f).as_(f) for f in fnames),
+            where=ranked.number == 1)
+
+    def _get_infrastructure_cost_date(self):
+        "Return the date of the infrastructure rates"
+        pool = Pool()
+        Date = pool.get('ir.date')
+        return (self.effective_date or self.planned_date
+            or Date.today())
+
+    @classmethod
+    def _get_currency_rate(cls, from_currency, to_currency, date):
+        """Return the rate to convert from currency to currency at the date
+
+        The rates are cached for the transaction."""
+        pool = Pool()
+        Currency = pool.get('currency.currency')
+        if from_currency == to_currency:
+            return Decimal(1)
+        transaction = Transaction()
+        transaction.join(_CostMemoDataManager())
+        rates = _currency_rates.setdefault(transaction, {})
+        key = (from_currency, to_currency, date)
+        if key not in rates:
+            with Transaction().set_context(date=date):
+                rates[key] = Currency.compute(
+                    from_currency, Decimal(1), to_currency, round=False)
+        return rates[key]
+
+    def _compute_infrastructure_cost(self, quantity, drivers):
+        "Return the infrastructure cost for the quantity of lot outputs"
+        cost = quantity * drivers['infrastructure_cost']
+        cost += drivers['infrastructure_cost_batch']
+        if self.duration and drivers['infrastructure_cost_hour']:
+            hours = Decimal(str(self.duration.total_seconds())) / 3600
+            cost += hours * drivers['infrastructure_cost_hour']
         return cost
+
+    @classmethod
+    @instrumented
+    def get_expected_lot_unit_cost(cls, productions, name):
+        "Return the projected lot unit cost of the productions not yet done"
+        pool = Pool()
+        Product = pool.get('product.product')
+
+        costs = {p.id: None for p in productions}
+        productions = [p for p in productions
+            if p.state not in {'done', 'cancelled'}
+            and p.product and p.quantity and p.unit]
+
+        # Read the cost price of all the components at once
+        inputs = {p: p._get_expected_inputs() for p in productions}
+        products = Product.browse(list({
+                    i[0].id for lines in inputs.values() for i in lines}))
+        cost_prices = {p.id: p.cost_price or Decimal(0) for p in products}
+        drivers = cls.get_infrastructure_cost_drivers(
+            [p for p in productions if p.bom])
+
+        for production in productions:
+            cost = Decimal(0)
+            for product, quantity, cost_price in inputs[production]:
+                if cost_price is None:
+                    cost_price = cost_prices[product.id]
+                cost += quantity * cost_price
+            quantity = (Decimal(str(production.quantity))
+                * cls._get_uom_factor(
+                    production.unit, production.product.default_uom))
+            if production.bom:
+                cost += production._compute_infrastructure_cost(
+                    quantity, drivers[production.id])
+                if production.bom.cost_allocation:
+                    ratios = production._get_allocation_ratios()
+                    if ratios:
+                        cost *= sum(r for o, r in ratios.items()
+                            if o.product == production.product)
+            costs[production.id] = round_price(cost / quantity)
+        return costs
+
+    def _get_expected_inputs(self):
+        """Return the list of product, internal quantity and cost price
+        consumed by the production"""
+        if self.inputs:
+            return [(i.product, Decimal(str(i.internal_quantity or 0)),
+                    i.cost_price) for i in self.inputs
+                if i.state != 'cancelled']
+        elif self.bom:
+            factor = Decimal(str(self.bom.compute_factor(
+                        self.product, self.quantity, self.unit)))
+            return [(i.product, Decimal(str(i.quantity)) * factor
+                    * self._get_uom_factor(i.unit, i.product.default_uom),
+                    None) for i in self.bom.inputs]
+        return []
+
+    @classmethod
+    @instrumented
+    def _get_output_infrastructure_costs(cls, productions, outputs=None):
+        """Return the infrastructure cost per unit of product per output id
+
+        If outputs is set, the cost is computed only for those outputs."""
+        infrastructure_costs = cls._get_infrastructure_costs(productions)
+        quantities = cls._get_lot_output_quantities(productions)
+        if outputs is None:
+            production_outputs = {p: p.outputs for p in productions}
+        else:
+            production_outputs = defaultdict(list)
+            for output in outputs:
+                production_outputs[output.production_output].append(output)
+        costs = {}
+        for production in productions:
+            cost = infrastructure_costs.get(production.id)
+            if not cost:
+                continue
+            if production.bom.cost_allocation:
+                ratios = production._get_allocation_ratios()
+                for output, ratio in ratios.items():
+                    if output.internal_quantity:
+                        costs[output.id] = (cost * ratio
+                            / Decimal(str(output.internal_quantity)))
+            else:
+                unit_cost = cost / quantities[production.id]
+                for output in production_outputs[production]:
+                    if output.lot and output.product == production.product:
+                        costs[output.id] = unit_cost
+        return costs
+
+    def _get_allocation_outputs(self):
+        "Return the outputs to which the cost is allocated"
+        return [o for o in self.outputs
+            if o.state != 'cancelled'
+            and o.to_location.type != 'lost_found']
+
+    def _get_allocation_key(self, output):
+        "Return the allocation key of the output or None if it is missing"
+        pool = Pool()
+        Uom = pool.get('product.uom')
+        ModelData = pool.get('ir.model.data')
+        product = output.product
+        quantity = Decimal(str(output.internal_quantity or 0))
+        if self.bom.cost_allocation == 'quantity':
+            return quantity
+        elif self.bom.cost_allocation == 'weight':
+            # weight is defined by product_measurements
+            if not getattr(product, 'weight', None):
+                return None
+            kilogram = Uom(ModelData.get_id('product', 'uom_kilogram'))
+            weight = Uom.compute_qty(
+                product.weight_uom, product.weight, kilogram, round=False)
+            return quantity * Decimal(str(weight))
+        elif self.bom.cost_allocation == 'list_price':
+            return quantity * (product.list_price_used or 0)
+
+    def _get_allocation_ratios(self, strict=False):
+        """Return the ratio of the cost allocated to each output
+
+        If strict is set, an error is raised when the key of an output is
+        missing, otherwise the key is taken as null."""
+        outputs = self._get_allocation_outputs()
+        if not outputs:
+            return {}
+        keys = {o: self._get_allocation_key(o) for o in outputs}
+        for output, key in keys.items():
+            if key is None:
+                if strict:
+                    raise AllocationError(gettext(
+                            'production_lot_cost'
+                            '.msg_allocation_weight_missing',
+                            production=self.rec_name,
+                            product=output.product.rec_name))
+                keys[output] = Decimal(0)
+        total = sum(keys.values())
+        if not total:
+            return {o: Decimal(1) / len(outputs) for o in outputs}
+        return {o: k / total for o, k in keys.items()}
+
+    @classmethod
+    def set_cost(cls, productions):
+        allocated = [p for p in productions
+            if p.bom and p.bom.cost_allocation]
+        super().set_cost([p for p in productions if p not in allocated])
+        cls._allocate_cost(allocated)
+
+    @classmethod
+    @instrumented
+    def _allocate_cost(cls, productions):
+        "Set the unit price of the outputs using the BOM cost allocation"
+        pool = Pool()
+        Move = pool.get('stock.move')
+
+        costs = cls.get_cost(productions, 'cost') if productions else {}
+        moves = []
+        for production in productions:
+            cost = costs[production.id]
+            currency = production.company.currency
+            for output, ratio in production._get_allocation_ratios(
+                    strict=True).items():
+                if not output.quantity:
+                    unit_price = Decimal(0)
+                else:
+                    unit_price = round_price(
+                        cost * ratio / Decimal(str(output.quantity)))
+                if (output.unit_price != unit_price
+                        or output.currency != currency):
+                    output.unit_price = unit_price
+                    output.currency = currency
+                    moves.append(output)
+        Move.save(moves)
+
+    @classmethod
+    @ModelView.button
+    @Workflow.transition('done')
+    def do(cls, productions):
+        pool = Pool()
+        Date = pool.get('ir.date')
+        # The cost is computed with the infrastructure rates at the effective
+        # date so it must be set before
+        for company, c_productions in groupby(
+                productions, key=lambda p: p.company):
+            with Transaction().set_context(company=company.id):
+                today = Date.today()
+            cls.write([p for p in c_productions if not p.effective_date], {
+                    'effective_date': today,
+                    })
+        super().do(productions)
+        cls.set_lot_cost_lines(productions)
+        cls.check_lot_costs(productions)
+
+    @classmethod
+    @instrumented
+    def set_lot_cost_lines(cls, productions, outputs=None):
+        """Replace the cost lines of the output lots by the production costs
+
+        The lines of a lot are computed from all the done outputs of the
+        production in the lot. If outputs is set, only the lines of their lots
+        are replaced."""
+        pool = Pool()
+        LotCostLine = pool.get('stock.lot.cost_line')
+
+        productions = set(productions)
+        if outputs is None:
+            outputs = [o for p in productions for o in p.outputs]
+        outputs = [o for o in outputs if o.production_output in productions]
+        lines = cls._search_lot_cost_lines(outputs)
+        # The lines of the previous lot of the outputs are also replaced
+        keys = {(o.production_output, o.lot) for o in outputs if o.lot}
+        keys.update((l.origin.production_output, l.lot) for l in lines)
+        lot_outputs = cls._group_lot_outputs(
+            [o for p in {p for p, _ in keys} for o in p.outputs], keys)
+        others = [o for g in lot_outputs.values() for o in g]
+        unit_costs = cls._get_output_infrastructure_costs(
+            list({p for p, _ in lot_outputs}), others)
+        outputs = set(outputs)
+        lines.extend(cls._search_lot_cost_lines(
+                [o for o in others if o not in outputs]))
+        to_save = []
+        for (production, lot), group in lot_outputs.items():
+            to_save.extend(
+                production._get_lot_cost_lines(lot, group, unit_costs))
+        LotCostLine.delete(lines)
+        LotCostLine.save(to_save)
+
+    @classmethod
+    def _search_lot_cost_lines(cls, outputs):
+        "Return the lot cost lines originated by the outputs"
+        pool = Pool()
+        LotCostLine = pool.get('stock.lot.cost_line')
+        lines = []
+        for sub_outputs in grouped_slice(outputs, backend.MAX_QUERY_PARAMS):
+            lines.extend(LotCostLine.search([
+                        ('origin', 'in', [str(o) for o in sub_outputs]),
+                        ], order=[]))
+        return lines
+
+    @staticmethod
+    def _group_lot_outputs(outputs, keys=None):
+        """Return the done outputs with a lot per production and lot
+
+        If keys is set, only the outputs of those production and lot pairs
+        are returned."""
+        lot_outputs = defaultdict(list)
+        for output in sorted(outputs, key=lambda o: o.id):
+            key = (output.production_output, output.lot)
+            if (output.lot and output.state == 'done'
+                    and (keys is None or key in keys)):
+                lot_outputs[key].append(output)
+        return lot_outputs
+
+    @staticmethod
+    def _get_lot_unit_costs(outputs, infrastructure_costs):
+        """Return the unit price and the infrastructure cost per unit of
+        product of the outputs weighted by their quantity"""
+        pool = Pool()
+        Uom = pool.get('product.uom')
+        quantities = [Decimal(str(o.internal_quantity or 0)) for o in outputs]
+        if not any(quantities):
+            quantities = [Decimal(1)] * len(outputs)
+        unit_price = infrastructure_cost = Decimal(0)
+        for output, quantity in zip(outputs, quantities):
+            unit_price += quantity * Uom.compute_price(output.unit,
+                output.unit_price or 0, output.product.default_uom)
+            infrastructure_cost += quantity * infrastructure_costs.get(
+                output.id, Decimal(0))
+        total = sum(quantities)
+        return unit_price / total, infrastructure_cost / total
+
+    def _get_lot_cost_lines(self, lot, outputs, infrastructure_costs):
+        """Return the inputs and infrastructure cost lines of the lot for its
+        outputs"""
+        pool = Pool()
+        LotCostLine = pool.get('stock.lot.cost_line')
+        ModelData = pool.get('ir.model.data')
+
+        unit_price, infrastructure_cost = self._get_lot_unit_costs(
+            outputs, infrastructure_costs)
+        infrastructure_cost = round_price(infrastructure_cost)
+        origin = outputs[0]
+
+        lines = [LotCostLine(
+                lot=lot,
+                category=ModelData.get_id(
+                    'production_lot_cost', 'cost_category_inputs_cost'),
+                unit_price=round_price(unit_price) - infrastructure_cost,
+                origin=origin,
+                )]
+        if infrastructure_cost:
+            lines.append(LotCostLine(
+                    lot=lot,
+                    category=ModelData.get_id('production_lot_cost',
+                        'cost_category_infrastructure_cost'),
+                    unit_price=infrastructure_cost,
+                    origin=origin,
+                    ))
+        return lines
+
+    @classmethod
+    @instrumented
+    def check_lot_costs(cls, productions):
+        "Warn about the output moves with a price different from its lot"
+        pool = Pool()
+        Uom = pool.get('product.uom')
+        Warning = pool.get('res.user.warning')
+
+        lot_outputs = cls._group_lot_outputs(
+            [o for p in productions for o in p.outputs])
+        lot_prices = cls._get_lot_cost_prices(
+            list({l.id for _, l in lot_outputs}))
+
+        uneven = []
+        for (_, lot), outputs in lot_outputs.items():
+            unit_price, _ = cls._get_lot_unit_costs(outputs, {})
+            lot_price = lot_prices.get(lot.id, Decimal(0))
+            if round_price(unit_price) == lot_price:
+                continue
+            for output in outputs:
+                uneven.append((output, round_price(Uom.compute_price(
+                                output.unit, output.unit_price or 0,
+                                output.product.default_uom)),
+                        lot_price))
+        if uneven:
+            warning_name = Warning.format(
+                'uneven_costs', [o for o, _, _ in uneven])
+            if Warning.check(warning_name):
+                raise UnevenCostWarning(warning_name, '\n'.join(
+                        gettext('production_lot_cost.msg_uneven_costs',
+                            move=o.rec_name,
+                            move_unit_price=u,
+                            lot=o.lot.rec_name,
+                            lot_unit_price=l)
+                        for o, u, l in uneven))
+
+    @classmethod
+    def do_chunked(cls, productions, size=100):
+        """Do the productions by chunks of size in independent transactions
+
+        Return a report as a list of tuples with the productions of the chunk,
+        its status (done, failed or queued) and a message.
+        When queue workers are running, the chunks are pushed as tasks in the
+        production queue and processed in parallel. The queued chunks are done
+        without the warnings like the uneven costs."""
+        has_worker = config.getboolean('queue', 'worker', default=False)
+        transaction = Transaction()
+        report = []
+        for sub_productions in grouped_slice(productions, size):
+            ids = [p.id for p in sub_productions]
+            if has_worker:
+                with transaction.set_context(queue_name='production'):
+                    task_id, = cls.__queue__.do_chunk(ids)
+                report.append((ids, 'queued', str(task_id)))
+                continue
+            try:
+                with transaction.new_transaction():
+                    cls.do_chunk(cls.browse(ids))
+            except (UserError, UserWarning) as exception:
+                logger.info("do chunk %s failed: %s", ids, exception.message)
+                report.append((ids, 'failed', exception.message))
+            except Exception as exception:
+                # Keep doing the next chunks whatever failed in this one
+                logger.exception("do chunk %s failed", ids)
+                report.append((ids, 'failed', str(exception)))
+            else:
+                report.append((ids, 'done', ''))
+        return report
+
+    @classmethod
+    def do_chunk(cls, productions):
+        "Do the productions which are still running"
+        cls.do([p for p in productions if p.state == 'running'])
+
+    @classmethod
+    def _lot_costs_query(cls):
+        """Return the query joining the done lot outputs with their cost lines
+        and a dictionary of its tables and cost columns"""
+        pool = Pool()
+        BOM = pool.get('production.bom')
+        Lot = pool.get('stock.lot')
+        LotCostLine = pool.get('stock.lot.cost_line')
+        Move = pool.get('stock.move')
+        ModelData = pool.get('ir.model.data')
+        production = cls.__table__()
+        bom = BOM.__table__()
+        lot = Lot.__table__()
+        line = LotCostLine.__table__()
+        move = Move.__table__()
+        origin = Move.__table__()
+
+        def category_sum(category):
+            category_id = ModelData.get_id('production_lot_cost', category)
+            return Sum(Case((line.category == category_id, line.unit_price),
+                    else_=Literal(0)))
+        # The lines are shared by the outputs of the production in the lot
+        lines = (line
+            .join(origin,
+                condition=line.origin == Concat('stock.move,', origin.id))
+            .select(
+                origin.production_output.as_('production'),
+                line.lot.as_('lot'),
+                category_sum('cost_category_inputs_cost').as_('inputs_cost'),
+                category_sum('cost_category_infrastructure_cost').as_(
+                    'infrastructure_cost'),
+                where=origin.production_output != Null,
+                group_by=[origin.production_output, line.lot]))
+
+        query = (move
+            .join(production,
+                condition=(move.production_output == production.id)
+                & (production.state == 'done')
+                & (move.state == 'done'))
+            .join(lot, condition=move.lot == lot.id)
+            .join(bom, 'LEFT', condition=production.bom == bom.id)
+            .join(lines, 'LEFT',
+                condition=(lines.production == production.id)
+                & (lines.lot == move.lot)))
+        inputs_cost = Coalesce(lines.inputs_cost, 0)
+        infrastructure_cost = Coalesce(lines.infrastructure_cost, 0)
+        return query, {
+            'production': production,
+            'bom': bom,
+            'lot': lot,
+            'move': move,
+            'inputs_cost': inputs_cost,
+            'infrastructure_cost': infrastructure_cost,
+            'unit_cost': inputs_cost + infrastructure_cost,
+            }
+
+    @classmethod
+    def lot_costs(cls, start_date, end_date, size=1000):
+        """Yield the cost of the lots produced between the dates as tuples of:
+        lot, production, BOM, quantity, inputs cost, infrastructure cost and
+        unit cost
+        The rows are read from a single cursor by chunks of size."""
+        query, tables = cls._lot_costs_query()
+        production, move = tables['production'], tables['move']
+        query = query.select(
+            tables['lot'].number, production.number, tables['bom'].name,
+            move.internal_quantity, tables['inputs_cost'],
+            tables['infrastructure_cost'], tables['unit_cost'],
+            where=(production.effective_date >= start_date)
+            & (production.effective_date <= end_date),
+            order_by=[production.effective_date, production.id, move.id])
+
+        connection = Transaction().connection
+        if backend.name == 'postgresql':
+            # Use a server-side cursor to not load all the rows in memory
+            # with a unique name to allow concurrent exports
+            cursor = connection.cursor(
+                name='production_lot_costs_%s' % uuid.uuid4().hex)
+        else:
+            cursor = connection.cursor()
+        try:
+            cursor.execute(*query)
+            while rows := cursor.fetchmany(size):
+                for row in rows:
+                    # SQLite returns float for numeric values
+                    yield row[:4] + tuple(
+                        v if isinstance(v, Decimal) else Decimal(str(v))
+                        for v in row[4:])
+        finally:
+            cursor.close()
+
+    @classmethod
+    def write_lot_costs_csv(cls, file, start_date, end_date):
+        "Write the lot costs produced between the dates as CSV to file"
+        writer = csv.writer(file)
+        writer.writerow(['Lot', 'Production', 'BOM', 'Quantity',
+                'Inputs Cost', 'Infrastructure Cost', 'Unit Cost'])
+        writer.writerows(cls.lot_costs(start_date, end_date))
+
+
+class DoChunked(Wizard):
+    "Do Productions by Chunks"
+    __name__ = 'production.do_chunked'
+    start = StateView('production.do_chunked.start',
+        'production_lot_cost.do_chunked_start_view_form', [
+            Button("Cancel", 'end', 'tryton-cancel'),
+            Button("Do", 'do_', 'tryton-ok', default=True),
+            ])
+    do_ = StateTransition()
+    result = StateView('production.do_chunked.result',
+        'production_lot_cost.do_chunked_result_view_form', [
+            Button("Close", 'end', 'tryton-close', default=True),
+            ])
+
+    def default_start(self, fields):
+        return {
+            'productions': len(self.records),
+            }
+
+    def transition_do_(self):
+        report = self.model.do_chunked(self.records, size=self.start.size)
+        lines = []
+        for i, (ids, status, message) in enumerate(report, 1):
+            lines.append(gettext(
+                    'production_lot_cost.msg_do_chunk_%s' % status,
+                    chunk=i, productions=len(ids), message=message))
+        self.result.report = '\n'.join(lines)
+        return 'result'
+
+    def default_result(self, fields):
+        return {
+            'report': self.result.report,
+            }
+
+
+class DoChunkedStart(ModelView):
+    "Do Productions by Chunks"
+    __name__ = 'production.do_chunked.start'
+    productions = fields.Integer("Productions", readonly=True)
+    size = fields.Integer(
+        "Chunk Size", required=True,
+        domain=[('size', '>', 0)],
+        help="The number of productions done per transaction.")
+
+    @classmethod
+    def default_size(cls):
+        return 100
+
+
+class DoChunkedResult(ModelView):
+    "Do Productions by Chunks"
+    __name__ = 'production.do_chunked.result'
+    report = fields.Text("Report", readonly=True)
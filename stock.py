@@ -0,0 +1,321 @@
+# The COPYRIGHT file at the top level of this repository contains the full
+# copyright notices and license terms.
+from collections import defaultdict
+from decimal import Decimal
+
+from sql import Literal, Null
+from sql.aggregate import Max, Sum
+from sql.conditionals import Case
+from sql.functions import CurrentTimestamp
+
+from trytond import backend
+from trytond.model import Index, ModelSQL, ModelView, Workflow, fields
+from trytond.modules.product import price_digits
+from trytond.pool import Pool, PoolMeta
+from trytond.tools import grouped_slice
+from trytond.transaction import Transaction
+
+
+class Move(metaclass=PoolMeta):
+    __name__ = 'stock.move'
+
+    @classmethod
+    def _production_cost_fields(cls):
+        "Return the fields that change the cost of the production"
+        return {'product', 'unit', 'quantity', 'lot', 'state', 'cost_price',
+            'production_input', 'production_output'}
+
+    @property
+    def production_lot_quantity(self):
+        "The quantity of the move counted in the lot outputs of its production"
+        production = self.production_output
+        if (production and production.bom
+                and self.lot
+                and self.state != 'cancelled'
+                and self.product == production.product):
+            return Decimal(str(self.internal_quantity or 0))
+        return Decimal(0)
+
+    @classmethod
+    def _get_cost_changes(cls, moves):
+        """Return the productions for which the cost must be recomputed and
+        the lot output quantity per production"""
+        productions = set()
+        quantities = defaultdict(Decimal)
+        for move in moves:
+            if move.production_input:
+                productions.add(move.production_input.id)
+            if move.production_output:
+                quantities[move.production_output.id] += (
+                    move.production_lot_quantity)
+        return productions, quantities
+
+    @classmethod
+    def _update_production_costs(cls, before, after, outputs):
+        """Update the cost of the productions from the changes before and
+        after
+        Productions with only output changes are updated incrementally."""
+        pool = Pool()
+        Production = pool.get('production')
+        productions = before[0] | after[0]
+        deltas = {}
+        for production in before[1].keys() | after[1].keys():
+            deltas[production] = (after[1].get(production, 0)
+                - before[1].get(production, 0))
+        Production.clear_cost_memo(productions | deltas.keys())
+        Production.set_stored_cost(Production.browse(productions))
+        Production.apply_output_changes(
+            Production.browse(deltas.keys() - productions), deltas,
+            [o for o in outputs if o.production_output])
+
+    @classmethod
+    def create(cls, vlist):
+        moves = super().create(vlist)
+        cls._update_production_costs(
+            (set(), {}), cls._get_cost_changes(moves), moves)
+        return moves
+
+    @classmethod
+    def write(cls, *args):
+        actions = iter(args)
+        moves = []
+        for records, values in zip(actions, actions):
+            if values.keys() & cls._production_cost_fields():
+                moves.extend(records)
+        before = cls._get_cost_changes(cls.browse(moves))
+        super().write(*args)
+        moves = cls.browse(moves)
+        cls._update_production_costs(
+            before, cls._get_cost_changes(moves), moves)
+
+    @classmethod
+    def delete(cls, moves):
+        before = cls._get_cost_changes(moves)
+        super().delete(moves)
+        cls._update_production_costs(before, (set(), {}), [])
+
+
+class Lot(metaclass=PoolMeta):
+    __name__ = 'stock.lot'
+    production = fields.Function(fields.Many2One(
+            'production', "Production",
+            help="The production that produced the lot."),
+        'get_production_cost')
+    inputs_cost = fields.Function(fields.Numeric(
+            "Inputs Cost", digits=price_digits,
+            help="The part of the cost price coming from the inputs."),
+        'get_production_cost')
+    infrastructure_cost = fields.Function(fields.Numeric(
+            "Infrastructure Cost", digits=price_digits,
+            help="The part of the cost price coming from the infrastructure."),
+        'get_production_cost')
+
+    @classmethod
+    def get_production_cost(cls, lots, names):
+        "Return the producing production and the cost breakdown of the lots"
+        pool = Pool()
+        LotCostLine = pool.get('stock.lot.cost_line')
+        ModelData = pool.get('ir.model.data')
+        Move = pool.get('stock.move')
+        Production = pool.get('production')
+        lot = cls.__table__()
+        line = LotCostLine.__table__()
+        move = Move.__table__()
+        production = Production.__table__()
+        cursor = Transaction().connection.cursor()
+
+        def category_sum(category):
+            category_id = ModelData.get_id('production_lot_cost', category)
+            return Sum(Case((line.category == category_id, line.unit_price),
+                    else_=Null))
+
+        result = {n: {l.id: None for l in lots} for n in names}
+        for sub_lots in grouped_slice(lots, backend.MAX_QUERY_PARAMS):
+            sub_ids = [l.id for l in sub_lots]
+            lines = line.select(
+                line.lot.as_('lot'),
+                category_sum('cost_category_inputs_cost').as_('inputs_cost'),
+                category_sum('cost_category_infrastructure_cost').as_(
+                    'infrastructure_cost'),
+                where=fields.SQL_OPERATORS['in'](line.lot, sub_ids),
+                group_by=[line.lot])
+            outputs = (move
+                .join(production,
+                    condition=move.production_output == production.id)
+                .select(
+                    move.lot.as_('lot'),
+                    Max(production.id).as_('production'),
+                    where=fields.SQL_OPERATORS['in'](move.lot, sub_ids)
+                    & (move.state == 'done')
+                    & (production.state == 'done'),
+                    group_by=[move.lot]))
+            cursor.execute(*lot
+                .join(lines, 'LEFT', condition=lines.lot == lot.id)
+                .join(outputs, 'LEFT', condition=outputs.lot == lot.id)
+                .select(
+                    lot.id, outputs.production,
+                    lines.inputs_cost, lines.infrastructure_cost,
+                    where=fields.SQL_OPERATORS['in'](lot.id, sub_ids)))
+            for lot_id, production_id, inputs_cost, infrastructure_cost in (
+                    cursor):
+                values = {
+                    'production': production_id,
+                    'inputs_cost': inputs_cost,
+                    'infrastructure_cost': infrastructure_cost,
+                    }
+                for name in names:
+                    value = values[name]
+                    # SQLite returns float for numeric values
+                    if (name != 'production' and value is not None
+                            and not isinstance(value, Decimal)):
+                        value = Decimal(str(value))
+                    result[name][lot_id] = value
+        return result
+
+
+class LotCostLine(metaclass=PoolMeta):
+    __name__ = 'stock.lot.cost_line'
+
+    @classmethod
+    def create(cls, vlist):
+        pool = Pool()
+        Production = pool.get('production')
+        lines = super().create(vlist)
+        Production.clear_cost_memo()
+        return lines
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        Production = pool.get('production')
+        super().write(*args)
+        Production.clear_cost_memo()
+
+    @classmethod
+    def delete(cls, lines):
+        pool = Pool()
+        Production = pool.get('production')
+        super().delete(lines)
+        Production.clear_cost_memo()
+
+
+class Period(metaclass=PoolMeta):
+    __name__ = 'stock.period'
+    lot_costs = fields.One2Many(
+        'stock.period.lot_cost', 'period', "Lot Costs", readonly=True)
+
+    @classmethod
+    def copy(cls, periods, default=None):
+        default = default.copy() if default is not None else {}
+        default.setdefault('lot_costs')
+        return super().copy(periods, default=default)
+
+    @classmethod
+    @ModelView.button
+    @Workflow.transition('draft')
+    def draft(cls, periods):
+        pool = Pool()
+        PeriodLotCost = pool.get('stock.period.lot_cost')
+        super().draft(periods)
+        PeriodLotCost.delete(PeriodLotCost.search([
+                    ('period', 'in', [p.id for p in periods]),
+                    ], order=[]))
+
+    @classmethod
+    @ModelView.button
+    @Workflow.transition('closed')
+    def close(cls, periods):
+        pool = Pool()
+        PeriodLotCost = pool.get('stock.period.lot_cost')
+        super().close(periods)
+        PeriodLotCost.fill(periods)
+
+
+class PeriodLotCost(ModelSQL, ModelView):
+    "Stock Period Lot Cost"
+    __name__ = 'stock.period.lot_cost'
+    period = fields.Many2One(
+        'stock.period', "Period",
+        required=True, readonly=True, ondelete='CASCADE')
+    lot = fields.Many2One(
+        'stock.lot', "Lot", required=True, readonly=True, ondelete='CASCADE')
+    production = fields.Many2One(
+        'production', "Production", readonly=True, ondelete='SET NULL')
+    internal_quantity = fields.Float("Internal Quantity", readonly=True)
+    inputs_cost = fields.Numeric(
+        "Inputs Cost", digits=price_digits, readonly=True)
+    infrastructure_cost = fields.Numeric(
+        "Infrastructure Cost", digits=price_digits, readonly=True)
+    unit_cost = fields.Numeric("Unit Cost", digits=price_digits, readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.update({
+                Index(
+                    t,
+                    (t.lot, Index.Range()),
+                    (t.period, Index.Range()),
+                    include=[t.unit_cost]),
+                Index(t, (t.period, Index.Range())),
+                })
+
+    @classmethod
+    def fill(cls, periods):
+        "Freeze the cost of the lots produced during the periods"
+        pool = Pool()
+        Period = pool.get('stock.period')
+        Production = pool.get('production')
+        table = cls.__table__()
+        cursor = Transaction().connection.cursor()
+
+        for period in periods:
+            previous = Period.search([
+                    ('company', '=', period.company.id),
+                    ('date', '<', period.date),
+                    ], order=[('date', 'DESC')], limit=1)
+            query, tables = Production._lot_costs_query()
+            production, move = tables['production'], tables['move']
+            where = ((production.company == period.company.id)
+                & (production.effective_date <= period.date))
+            if previous:
+                previous, = previous
+                where &= production.effective_date > previous.date
+            cursor.execute(*table.insert([
+                        table.create_uid, table.create_date,
+                        table.period, table.lot, table.production,
+                        table.internal_quantity, table.inputs_cost,
+                        table.infrastructure_cost, table.unit_cost,
+                        ],
+                    query.select(
+                        Literal(Transaction().user), CurrentTimestamp(),
+                        Literal(period.id), move.lot, production.id,
+                        move.internal_quantity, tables['inputs_cost'],
+                        tables['infrastructure_cost'], tables['unit_cost'],
+                        where=where)))
+
+    @classmethod
+    def get_unit_costs(cls, lots, date):
+        """Return the unit cost per lot id frozen by the last closed period
+        at the date"""
+        pool = Pool()
+        Period = pool.get('stock.period')
+        table = cls.__table__()
+        period = Period.__table__()
+        cursor = Transaction().connection.cursor()
+
+        costs = {}
+        query = table.join(period, condition=table.period == period.id)
+        for sub_lots in grouped_slice(lots, backend.MAX_QUERY_PARAMS):
+            cursor.execute(*query.select(table.lot, table.unit_cost,
+                    where=fields.SQL_OPERATORS['in'](
+                        table.lot, [l.id for l in sub_lots])
+                    & (period.state == 'closed')
+                    & (period.date <= date),
+                    order_by=[period.date.asc]))
+            # The most recent period overwrites the older ones
+            # SQLite returns float for numeric values
+            costs.update((l, c if isinstance(c, Decimal) else Decimal(str(c)))
+                for l, c in cursor)
+        return costs
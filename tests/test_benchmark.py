@@ -0,0 +1,222 @@
+# The COPYRIGHT file at the top level of this repository contains the full
+# copyright notices and license terms.
+"""Benchmark of the production lot costing
+
+It is skipped unless the BENCHMARK environment variable is set and it only
+runs on SQLite. The size of the data set is set with BENCHMARK_BOMS and
+BENCHMARK_PRODUCTIONS. The results are written as JSON to BENCHMARK_OUTPUT
+and, if BENCHMARK_BASELINE is the path of a previous output, the timings
+must not be slower than BENCHMARK_TOLERANCE times the baseline.
+"""
+import json
+import math
+import os
+import time
+import unittest
+from contextlib import contextmanager
+from decimal import Decimal
+
+from trytond import backend
+from trytond.modules.company.tests import create_company, set_company
+from trytond.pool import Pool
+from trytond.tests.test_tryton import activate_module, with_transaction
+from trytond.transaction import Transaction
+
+BOMS = int(os.getenv('BENCHMARK_BOMS', 10))
+PRODUCTIONS = int(os.getenv('BENCHMARK_PRODUCTIONS', 1000))
+OUTPUTS = 3
+TOLERANCE = float(os.getenv('BENCHMARK_TOLERANCE', 1.2))
+
+# Maximum number of queries per chunk of backend.MAX_QUERY_PARAMS records
+# and per record
+MAX_QUERIES = {
+    'read_cost': (10, 0),
+    'reread_cost': (2, 0),
+    'read_lot_cost_price': (5, 0),
+    'read_lot_cost_breakdown': (5, 0),
+    'do': (50, 10),
+    }
+
+
+@unittest.skipUnless(os.getenv('BENCHMARK'), "BENCHMARK not set")
+@unittest.skipUnless(backend.name == 'sqlite', "requires SQLite")
+class ProductionLotCostBenchmark(unittest.TestCase):
+    "Benchmark production lot cost"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        activate_module('production_lot_cost')
+        cls.results = {
+            'boms': BOMS,
+            'productions': PRODUCTIONS,
+            'outputs': OUTPUTS,
+            }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        output = os.getenv('BENCHMARK_OUTPUT')
+        if output:
+            with open(output, 'w') as file:
+                json.dump(cls.results, file, indent=2, sort_keys=True)
+
+    @contextmanager
+    def measure(self, name, count):
+        "Time and count the queries executed by the block"
+        connection = Transaction().connection
+        queries = []
+        connection.set_trace_callback(queries.append)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            connection.set_trace_callback(None)
+        queries = [q for q in queries
+            if not q.startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK'))]
+        self.results[name] = {
+            'queries': len(queries),
+            'time': duration,
+            'time_per_record': duration / count,
+            }
+        per_chunk, per_record = MAX_QUERIES[name]
+        chunks = math.ceil(count / backend.MAX_QUERY_PARAMS)
+        self.assertLessEqual(
+            len(queries), per_chunk * chunks + per_record * count, name)
+        self.check_baseline(name, duration)
+
+    def check_baseline(self, name, duration):
+        path = os.getenv('BENCHMARK_BASELINE')
+        if not path:
+            return
+        with open(path) as file:
+            baseline = json.load(file)
+        if (baseline.get('productions') == PRODUCTIONS
+                and name in baseline):
+            self.assertLessEqual(
+                duration, baseline[name]['time'] * TOLERANCE, name)
+
+    def create_data(self):
+        "Create the BOMs and running productions with lot outputs"
+        pool = Pool()
+        Uom = pool.get('product.uom')
+        Template = pool.get('product.template')
+        BOM = pool.get('production.bom')
+        Location = pool.get('stock.location')
+        Lot = pool.get('stock.lot')
+        Move = pool.get('stock.move')
+        Production = pool.get('production')
+
+        unit, = Uom.search([('name', '=', 'Unit')])
+        kilogram, = Uom.search([('name', '=', 'Kilogram')])
+        gram, = Uom.search([('name', '=', 'Gram')])
+        warehouse, = Location.search([('code', '=', 'WH')])
+        production_location, = Location.search([('code', '=', 'PROD')])
+        warehouse.production_location = production_location
+        warehouse.save()
+
+        component, = Template.create([{
+                    'name': "Component",
+                    'default_uom': unit.id,
+                    'type': 'goods',
+                    'products': [('create', [{
+                                    'cost_price': Decimal(2),
+                                    }])],
+                    }])
+        component, = component.products
+        templates = Template.create([{
+                    'name': "Product %s" % i,
+                    'default_uom': kilogram.id,
+                    'type': 'goods',
+                    'producible': True,
+                    'list_price': Decimal(30),
+                    'products': [('create', [{}])],
+                    } for i in range(BOMS)])
+        products = [t.products[0] for t in templates]
+        boms = BOM.create([{
+                    'name': "BOM %s" % i,
+                    'infrastructure_cost': Decimal('1.5'),
+                    'infrastructure_cost_batch': Decimal('0.5'),
+                    'inputs': [('create', [{
+                                    'product': component.id,
+                                    'quantity': 3,
+                                    'unit': unit.id,
+                                    }])],
+                    'outputs': [('create', [{
+                                    'product': product.id,
+                                    'quantity': 1,
+                                    'unit': kilogram.id,
+                                    }])],
+                    } for i, product in enumerate(products)])
+
+        productions = Production.create([{
+                    'product': products[i % BOMS].id,
+                    'bom': boms[i % BOMS].id,
+                    'quantity': 2,
+                    'unit': kilogram.id,
+                    'warehouse': warehouse.id,
+                    'location': production_location.id,
+                    } for i in range(PRODUCTIONS)])
+        Production.set_moves(productions)
+        Production.wait(productions)
+        Production.assign_force(productions)
+        Production.run(productions)
+
+        # Split the output in lots with mixed units
+        lots = Lot.create([{
+                    'number': '%s-%s' % (p.id, i),
+                    'product': p.product.id,
+                    } for p in productions for i in range(OUTPUTS)])
+        lots = iter(lots)
+        outputs = []
+        for production in productions:
+            output, = production.outputs
+            outputs.append(output)
+            output.lot = next(lots)
+            output.quantity = 1
+            for _ in range(OUTPUTS - 1):
+                outputs.append(Move(
+                        production_output=production,
+                        product=output.product,
+                        unit=gram,
+                        quantity=500,
+                        lot=next(lots),
+                        from_location=output.from_location,
+                        to_location=output.to_location,
+                        company=output.company,
+                        unit_price=Decimal(0),
+                        currency=output.currency,
+                        ))
+        Move.save(outputs)
+        return Production.browse([p.id for p in productions])
+
+    @with_transaction()
+    def test_production_lot_cost(self):
+        "Benchmark reading cost, doing productions and reading lot costs"
+        pool = Pool()
+        Production = pool.get('production')
+        Lot = pool.get('stock.lot')
+
+        company = create_company()
+        with set_company(company):
+            productions = self.create_data()
+            ids = [p.id for p in productions]
+
+            with self.measure('read_cost', len(ids)):
+                Production.read(ids, ['cost'])
+
+            with self.measure('reread_cost', len(ids)):
+                Production.read(ids, ['cost'])
+
+            with self.measure('do', len(ids)):
+                Production.do(Production.browse(ids))
+
+            lot_ids = [o.lot.id for p in Production.browse(ids)
+                for o in p.outputs]
+            with self.measure('read_lot_cost_price', len(lot_ids)):
+                Lot.read(lot_ids, ['cost_price'])
+
+            with self.measure('read_lot_cost_breakdown', len(lot_ids)):
+                Lot.read(lot_ids,
+                    ['production', 'inputs_cost', 'infrastructure_cost'])
@@ -1,14 +1,468 @@
-
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import datetime as dt
+import io
+import logging
+from decimal import Decimal
+from unittest.mock import patch
+
+from sql import Null
 
-from trytond.modules.company.tests import CompanyTestMixin
-from trytond.tests.test_tryton import ModuleTestCase
+from trytond.modules.company.tests import (
+    CompanyTestMixin, create_company, set_company)
+from trytond.modules.production_lot_cost import instrumentation
+from trytond.pool import Pool
+from trytond.tests.test_tryton import ModuleTestCase, with_transaction
+from trytond.transaction import Transaction
 
 
 class ProductionLotCostTestCase(CompanyTestMixin, ModuleTestCase):
     'Test ProductionLotCost module'
     module = 'production_lot_cost'
 
+    @with_transaction()
+    def test_period_lot_cost_unit_costs(self):
+        "Test the unit costs frozen by the closed periods"
+        pool = Pool()
+        Period = pool.get('stock.period')
+        PeriodLotCost = pool.get('stock.period.lot_cost')
+        Lot = pool.get('stock.lot')
+        Template = pool.get('product.template')
+        Uom = pool.get('product.uom')
+        today = dt.date.today()
+
+        company = create_company()
+        with set_company(company):
+            unit, = Uom.search([('name', '=', 'Unit')])
+            template, = Template.create([{
+                        'name': "Product",
+                        'default_uom': unit.id,
+                        'type': 'goods',
+                        'products': [('create', [{}])],
+                        }])
+            product, = template.products
+            lot, = Lot.create([{'number': '1', 'product': product.id}])
+            periods = Period.create([{
+                        'date': today - dt.timedelta(days=days),
+                        'company': company.id,
+                        } for days in [20, 10, 5]])
+            PeriodLotCost.create([{
+                        'period': period.id,
+                        'lot': lot.id,
+                        'internal_quantity': 1,
+                        'inputs_cost': cost,
+                        'infrastructure_cost': Decimal(0),
+                        'unit_cost': cost,
+                        } for period, cost in zip(periods, [
+                            Decimal(1), Decimal(2), Decimal(3)])])
+            Period.close(periods[:2])
+
+            self.assertEqual(PeriodLotCost.get_unit_costs(
+                    [lot], today - dt.timedelta(days=25)), {})
+            self.assertEqual(PeriodLotCost.get_unit_costs(
+                    [lot], today - dt.timedelta(days=15)), {lot.id: 1})
+            # The period in draft is ignored
+            self.assertEqual(
+                PeriodLotCost.get_unit_costs([lot], today), {lot.id: 2})
+            self.assertIsInstance(
+                PeriodLotCost.get_unit_costs([lot], today)[lot.id], Decimal)
+
+            Period.draft(periods[:1])
+            self.assertEqual(PeriodLotCost.get_unit_costs(
+                    [lot], today - dt.timedelta(days=15)), {})
+
+    @with_transaction()
+    def test_period_close_twice(self):
+        "Test closing or reopening twice a period"
+        pool = Pool()
+        Location = pool.get('stock.location')
+        Lot = pool.get('stock.lot')
+        Period = pool.get('stock.period')
+        PeriodLotCost = pool.get('stock.period.lot_cost')
+        Production = pool.get('production')
+        Template = pool.get('product.template')
+        Uom = pool.get('product.uom')
+        today = dt.date.today()
+        date = today - dt.timedelta(days=10)
+
+        company = create_company()
+        with set_company(company):
+            unit, = Uom.search([('name', '=', 'Unit')])
+            template, = Template.create([{
+                        'name': "Product",
+                        'default_uom': unit.id,
+                        'type': 'goods',
+                        'producible': True,
+                        'products': [('create', [{}])],
+                        }])
+            product, = template.products
+            lot, = Lot.create([{'number': '1', 'product': product.id}])
+            warehouse, = Location.search([('code', '=', 'WH')])
+            production_location, = Location.search([('code', '=', 'PROD')])
+            production, = Production.create([{
+                        'product': product.id,
+                        'quantity': 1,
+                        'unit': unit.id,
+                        'warehouse': warehouse.id,
+                        'location': production_location.id,
+                        'planned_date': date,
+                        'planned_start_date': date,
+                        'effective_date': date,
+                        'outputs': [('create', [{
+                                        'product': product.id,
+                                        'unit': unit.id,
+                                        'quantity': 1,
+                                        'lot': lot.id,
+                                        'from_location':
+                                        production_location.id,
+                                        'to_location':
+                                        warehouse.storage_location.id,
+                                        'company': company.id,
+                                        'unit_price': Decimal(0),
+                                        'currency': company.currency.id,
+                                        }])],
+                        }])
+            Production.wait([production])
+            Production.assign_force([production])
+            Production.run([production])
+            Production.do([production])
+            period, = Period.create([{
+                        'date': today - dt.timedelta(days=5),
+                        'company': company.id,
+                        }])
+
+            Period.close([period])
+            Period.close([period])
+            self.assertEqual(
+                PeriodLotCost.search_count([('period', '=', period.id)]), 1)
+
+            Period.draft([period])
+            Period.draft([period])
+            self.assertEqual(
+                PeriodLotCost.search_count([('period', '=', period.id)]), 0)
+
+    def create_productions(self, company, quantities):
+        "Create productions consuming the quantities of a component at 2"
+        pool = Pool()
+        Location = pool.get('stock.location')
+        Production = pool.get('production')
+        Template = pool.get('product.template')
+        Uom = pool.get('product.uom')
+
+        unit, = Uom.search([('name', '=', 'Unit')])
+        product_template, component_template = Template.create([{
+                    'name': "Product",
+                    'default_uom': unit.id,
+                    'type': 'goods',
+                    'producible': True,
+                    'products': [('create', [{}])],
+                    }, {
+                    'name': "Component",
+                    'default_uom': unit.id,
+                    'type': 'goods',
+                    'products': [('create', [{
+                                    'cost_price': Decimal(2),
+                                    }])],
+                    }])
+        product, = product_template.products
+        component, = component_template.products
+        warehouse, = Location.search([('code', '=', 'WH')])
+        production_location, = Location.search([('code', '=', 'PROD')])
+        return Production.create([{
+                    'product': product.id,
+                    'quantity': 1,
+                    'unit': unit.id,
+                    'warehouse': warehouse.id,
+                    'location': production_location.id,
+                    'inputs': [('create', [{
+                                    'product': component.id,
+                                    'unit': unit.id,
+                                    'quantity': quantity,
+                                    'from_location':
+                                    warehouse.storage_location.id,
+                                    'to_location': production_location.id,
+                                    'company': company.id,
+                                    }])] if quantity else [],
+                    } for quantity in quantities])
+
+    @with_transaction()
+    def test_production_cost_memo(self):
+        "Test the production costs memoized in the transaction"
+        pool = Pool()
+        Move = pool.get('stock.move')
+        Production = pool.get('production')
+
+        company = create_company()
+        with set_company(company):
+            production, = self.create_productions(company, [3])
+            input_, = production.inputs
+
+            Production.clear_cost_memo()
+            stats = Production.cost_memo_stats.copy()
+            self.assertEqual(
+                Production.get_cost([production], 'cost'),
+                {production.id: Decimal(6)})
+            self.assertEqual(
+                Production.get_cost([production], 'cost'),
+                {production.id: Decimal(6)})
+            stats.subtract(Production.cost_memo_stats)
+            self.assertEqual(-stats['hit'], 1)
+            self.assertEqual(-stats['miss'], 1)
+
+            # Changing an input removes the memoized cost
+            Move.write([input_], {'quantity': 4})
+            self.assertEqual(
+                Production.get_cost([production], 'cost'),
+                {production.id: Decimal(8)})
+            self.assertEqual(production.stored_cost, Decimal(8))
+
+    @with_transaction()
+    def test_production_cost_memo_rollback(self):
+        "Test the production costs memoized are removed on rollback"
+        pool = Pool()
+        Production = pool.get('production')
+        transaction = Transaction()
+
+        company = create_company()
+        with set_company(company):
+            production, = self.create_productions(company, [3])
+
+            Production.clear_cost_memo()
+            stats = Production.cost_memo_stats.copy()
+            self.assertEqual(
+                Production.get_cost([production], 'cost'),
+                {production.id: Decimal(6)})
+
+            transaction.rollback()
+            self.assertEqual(
+                Production.get_cost([production], 'cost'),
+                {production.id: Decimal(6)})
+            stats.subtract(Production.cost_memo_stats)
+            self.assertEqual(-stats['hit'], 0)
+            self.assertEqual(-stats['miss'], 2)
+
+    @with_transaction()
+    def test_fill_stored_cost(self):
+        "Test filling the stored cost of the existing productions"
+        pool = Pool()
+        Production = pool.get('production')
+        production_table = Production.__table__()
+        cursor = Transaction().connection.cursor()
+
+        company = create_company()
+        with set_company(company):
+            productions = self.create_productions(company, [3, 0, 5])
+            cursor.execute(*production_table.update(
+                    [production_table.stored_cost], [Null]))
+
+            Production._fill_stored_cost()
+
+            cursor.execute(*production_table.select(
+                    production_table.id, production_table.stored_cost,
+                    where=production_table.id.in_(
+                        [p.id for p in productions]),
+                    order_by=[production_table.id]))
+            self.assertEqual(
+                [(i, Decimal(str(c))) for i, c in cursor],
+                [(p.id, c) for p, c in zip(productions, [
+                            Decimal(6), Decimal(0), Decimal(10)])])
+
+    @with_transaction()
+    def test_lot_costs(self):
+        "Test the export of the lot costs produced between dates"
+        pool = Pool()
+        BOM = pool.get('production.bom')
+        Lot = pool.get('stock.lot')
+        Production = pool.get('production')
+        today = dt.date.today()
+
+        company = create_company()
+        with set_company(company):
+            productions = self.create_productions(company, [3, 3])
+            product = productions[0].product
+            component = productions[0].inputs[0].product
+            bom, = BOM.create([{
+                        'name': "BOM",
+                        'infrastructure_cost': Decimal('1.5'),
+                        'inputs': [('create', [{
+                                        'product': component.id,
+                                        'quantity': 3,
+                                        'unit': component.default_uom.id,
+                                        }])],
+                        'outputs': [('create', [{
+                                        'product': product.id,
+                                        'quantity': 1,
+                                        'unit': product.default_uom.id,
+                                        }])],
+                        }])
+            lots = Lot.create([
+                    {'number': str(i), 'product': product.id}
+                    for i in range(len(productions))])
+            for production, lot, days in zip(productions, lots, [10, 30]):
+                date = today - dt.timedelta(days=days)
+                Production.write([production], {
+                        'bom': bom.id,
+                        'planned_date': date,
+                        'planned_start_date': date,
+                        'effective_date': date,
+                        'outputs': [('create', [{
+                                        'product': product.id,
+                                        'unit': product.default_uom.id,
+                                        'quantity': 1,
+                                        'lot': lot.id,
+                                        'from_location':
+                                        production.location.id,
+                                        'to_location': production.warehouse
+                                        .storage_location.id,
+                                        'company': company.id,
+                                        'unit_price': Decimal(0),
+                                        'currency': company.currency.id,
+                                        }])],
+                        })
+            Production.wait(productions)
+            Production.assign_force(productions)
+            Production.run(productions)
+            Production.do(productions)
+
+            start_date = today - dt.timedelta(days=15)
+            rows = list(Production.lot_costs(start_date, today, size=1))
+            self.assertEqual(rows, [(
+                        '0', productions[0].number, "BOM", 1,
+                        Decimal(6), Decimal('1.5'), Decimal('7.5'))])
+            # Exports can be read at the same time
+            self.assertEqual(list(zip(
+                        Production.lot_costs(start_date, today),
+                        Production.lot_costs(start_date, today))),
+                [(rows[0], rows[0])])
+
+            file = io.StringIO()
+            Production.write_lot_costs_csv(file, start_date, today)
+            self.assertEqual(file.getvalue().splitlines(), [
+                    'Lot,Production,BOM,Quantity,Inputs Cost,'
+                    'Infrastructure Cost,Unit Cost',
+                    ','.join(map(str, rows[0])),
+                    ])
+
+    @with_transaction()
+    def test_production_output_quantity(self):
+        "Test the output quantity of productions with mixed units"
+        pool = Pool()
+        Location = pool.get('stock.location')
+        Move = pool.get('stock.move')
+        Production = pool.get('production')
+        Template = pool.get('product.template')
+        Uom = pool.get('product.uom')
+
+        kilogram, = Uom.search([('name', '=', 'Kilogram')])
+        gram, = Uom.search([('name', '=', 'Gram')])
+        unit, = Uom.search([('name', '=', 'Unit')])
+        template, = Template.create([{
+                    'name': "Product",
+                    'default_uom': kilogram.id,
+                    'type': 'goods',
+                    'producible': True,
+                    'products': [('create', [{}])],
+                    }])
+        product, = template.products
+        warehouse, = Location.search([('code', '=', 'WH')])
+        production_location, = Location.search([('code', '=', 'PROD')])
+
+        company = create_company()
+        with set_company(company):
+            def output(quantity, unit):
+                return {
+                    'product': product.id,
+                    'unit': unit.id,
+                    'quantity': quantity,
+                    'from_location': production_location.id,
+                    'to_location': warehouse.storage_location.id,
+                    'company': company.id,
+                    'unit_price': Decimal(0),
+                    'currency': company.currency.id,
+                    }
+            production, = Production.create([{
+                        'product': product.id,
+                        'quantity': 3,
+                        'unit': kilogram.id,
+                        'warehouse': warehouse.id,
+                        'location': production_location.id,
+                        'outputs': [('create', [
+                                    output(2, kilogram), output(500, gram)])],
+                        }])
+
+            self.assertEqual(
+                Production.get_output_quantities([production]),
+                {production.id: Decimal('2.5')})
+            self.assertEqual(production.output_qty, 2.5)
+            self.assertIsInstance(production.output_qty, float)
+
+            # The pending changes are used
+            production.outputs += (Move(**output(250, gram)),)
+            self.assertEqual(production.output_qty, 2.75)
+
+            # The unsaved productions are computed in memory
+            production = Production(
+                product=product, unit=gram,
+                outputs=[Move(**output(1, kilogram)), Move(**output(5, gram))])
+            self.assertEqual(production.output_qty, 1005)
+
+            with self.assertRaises(ValueError):
+                Production._get_uom_factor(unit, kilogram)
+
+    @with_transaction()
+    def test_do_chunked_failure(self):
+        "Test doing by chunks continues after an unexpected failure"
+        pool = Pool()
+        Production = pool.get('production')
+
+        company = create_company()
+        with set_company(company):
+            productions = self.create_productions(company, [1, 2, 3])
+
+            with patch.object(Production, 'do_chunk',
+                    side_effect=[None, RuntimeError("crash")]), \
+                    self.assertLogs(
+                        'trytond.modules.production_lot_cost.production',
+                        logging.ERROR):
+                report = Production.do_chunked(productions, size=2)
+            self.assertEqual(report, [
+                    ([p.id for p in productions[:2]], 'done', ''),
+                    ([productions[2].id], 'failed', "crash"),
+                    ])
+
+    @with_transaction()
+    def test_instrumented(self):
+        "Test the instrumentation of the costing methods"
+        pool = Pool()
+        Production = pool.get('production')
+        logger = logging.getLogger(instrumentation.__name__)
+
+        company = create_company()
+        with set_company(company):
+            production, = self.create_productions(company, [3])
+            production.unit
+
+            stats = []
+            with Transaction().set_context({
+                        instrumentation.CONTEXT_KEY: stats}):
+                Production.get_output_quantities([production])
+            stat, = stats
+            self.assertEqual(
+                stat['method'], 'production.get_output_quantities')
+            self.assertEqual(stat['records'], 1)
+            self.assertEqual(stat['queries'], 1)
+            # The production has no output
+            self.assertEqual(stat['rows'], 0)
+
+            level = logger.level
+            logger.setLevel(logging.INFO)
+            try:
+                with patch.object(
+                        instrumentation, '_count_queries') as count_queries:
+                    Production.get_output_quantities([production])
+                count_queries.assert_not_called()
+            finally:
+                logger.setLevel(level)
+
 
 del ModuleTestCase
@@ -196,3 +196,8 @@ class Test(unittest.TestCase):
         output, = production.outputs
         self.assertEqual(output.unit_price, Decimal('13.5'))
         self.assertEqual(output.lot.cost_price, Decimal('13.5000'))
+        self.assertEqual(
+            sorted((l.category.name, l.unit_price)
+                for l in output.lot.cost_lines),
+            [('Infrastructure Cost', Decimal('1.0')),
+                ('Inputs Cost', Decimal('12.5'))])
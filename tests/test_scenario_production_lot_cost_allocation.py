@@ -0,0 +1,105 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.exceptions import UserError
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, lot_cost_lines, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        bom = data['bom']
+        Lot = data['Lot']
+
+        # Add a by-product to the BOM
+        ProductTemplate = Model.get('product.template')
+        BOMOutput = Model.get('production.bom.output')
+        template = ProductTemplate()
+        template.name = 'by-product'
+        template.default_uom = data['unit']
+        template.type = 'goods'
+        template.list_price = Decimal(10)
+        template.save()
+        by_product, = template.products
+        output = BOMOutput()
+        bom.outputs.append(output)
+        output.product = by_product
+        output.quantity = 2
+        bom.save()
+
+        def produce(number):
+            lot = Lot(number=number, product=data['product'])
+            lot.save()
+            production = create_production(bom, 2, lot=lot)
+            do_production(production)
+            self.assertEqual(production.cost, Decimal('15.0000'))
+            return production, lot
+
+        def unit_prices(production):
+            return sorted(
+                (o.product.rec_name, o.unit_price)
+                for o in production.outputs)
+
+        # Allocate the cost by quantity
+        bom.cost_allocation = 'quantity'
+        bom.save()
+        production, lot = produce('1')
+        self.assertEqual(unit_prices(production), [
+                ('by-product', Decimal('2.5000')),
+                ('product', Decimal('2.5000')),
+                ])
+        self.assertEqual(lot_cost_lines(lot), [
+                ('Infrastructure Cost', Decimal('0.5000')),
+                ('Inputs Cost', Decimal('2.0000')),
+                ])
+
+        # Allocate the cost by list price
+        bom.cost_allocation = 'list_price'
+        bom.save()
+        production, lot = produce('2')
+        self.assertEqual(unit_prices(production), [
+                ('by-product', Decimal('1.5000')),
+                ('product', Decimal('4.5000')),
+                ])
+        self.assertEqual(lot_cost_lines(lot), [
+                ('Infrastructure Cost', Decimal('0.9000')),
+                ('Inputs Cost', Decimal('3.6000')),
+                ])
+
+        # Allocate the cost by weight without weight on the products
+        bom.cost_allocation = 'weight'
+        bom.save()
+        lot = Lot(number='3', product=data['product'])
+        lot.save()
+        production = create_production(bom, 2, lot=lot)
+        production.click('wait')
+        production.click('assign_try')
+        production.click('run')
+        with self.assertRaisesRegex(UserError, 'must have a weight'):
+            production.click('do')
@@ -0,0 +1,72 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+        bom = data['bom']
+
+        # Create productions of the BOM
+        productions = []
+        for number in ['1', '2']:
+            lot = Lot(number=number, product=data['product'])
+            lot.save()
+            production = create_production(bom, 2, lot=lot)
+            production.click('wait')
+            productions.append(production)
+        self.assertEqual(
+            [p.cost for p in productions],
+            [Decimal('15.0000'), Decimal('15.0000')])
+
+        # Changing the infrastructure cost of the BOM updates the costs
+        bom.infrastructure_cost = Decimal('2')
+        bom.save()
+        for production in productions:
+            production.reload()
+            self.assertEqual(production.cost, Decimal('16.0000'))
+            self.assertEqual(production.stored_cost, production.cost)
+
+        # And so does the cost per batch
+        bom.infrastructure_cost_batch = Decimal('5')
+        bom.save()
+        for production in productions:
+            production.reload()
+            self.assertEqual(production.cost, Decimal('21.0000'))
+            self.assertEqual(production.stored_cost, production.cost)
+
+        # A new production uses the cached cost
+        lot = Lot(number='3', product=data['product'])
+        lot.save()
+        production = create_production(bom, 2, lot=lot)
+        self.assertEqual(production.cost, Decimal('21.0000'))
+        self.assertEqual(production.stored_cost, production.cost)
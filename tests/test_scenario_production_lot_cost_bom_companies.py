@@ -0,0 +1,76 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company, get_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+        company = get_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+        bom = data['bom']
+
+        # Create another company
+        Company = Model.get('company.company')
+        Party = Model.get('party.party')
+        party = Party(name="Other Company")
+        party.save()
+        other_company = Company(party=party, currency=company.currency)
+        other_company.save()
+        user = User(config.user)
+        user.companies.append(Company(other_company.id))
+        user.save()
+
+        def set_company(company):
+            user = User(config.user)
+            user.company = company
+            user.save()
+            config._context = User.get_preferences(True, {})
+
+        # Create a production of the BOM in the other company
+        set_company(other_company)
+        lot = Lot(number='1', product=data['product'])
+        lot.save()
+        production = create_production(bom, 2, lot=lot)
+        production.click('wait')
+        self.assertEqual(production.company, other_company)
+        cost = production.cost
+        self.assertEqual(production.stored_cost, cost)
+
+        # Change the infrastructure cost of the BOM from the first company
+        set_company(company)
+        bom.infrastructure_cost = Decimal('2')
+        bom.save()
+
+        # The production of the other company is updated
+        set_company(other_company)
+        production.reload()
+        self.assertEqual(production.cost, cost + Decimal('1.0000'))
+        self.assertEqual(production.stored_cost, production.cost)
@@ -0,0 +1,89 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, lot_cost_lines, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+        bom = data['bom']
+
+        # Copy the BOM
+        other_bom, = bom.duplicate()
+
+        # Run and do productions
+        lots, productions = [], []
+        for number, bom_ in [('1', bom), ('2', bom), ('3', other_bom)]:
+            lot = Lot(number=number, product=data['product'])
+            lot.save()
+            production = create_production(bom_, 2, lot=lot)
+            do_production(production)
+            lots.append(lot)
+            productions.append(production)
+        lot = Lot(number='4', product=data['product'])
+        lot.save()
+        running = create_production(bom, 2, lot=lot)
+        running.click('wait')
+        running.click('assign_try')
+        running.click('run')
+        self.assertEqual(
+            [l.cost_price for l in lots], [Decimal('7.5000')] * 3)
+
+        # Changing the infrastructure cost of the BOM revalues its lots
+        bom.infrastructure_cost = Decimal('2')
+        bom.save()
+        for lot in lots[:2]:
+            self.assertEqual(lot_cost_lines(lot), [
+                    ('Infrastructure Cost', Decimal('2.0000')),
+                    ('Inputs Cost', Decimal('6.0000')),
+                    ])
+        for production in productions[:2] + [running]:
+            production.reload()
+            self.assertEqual(production.cost, Decimal('16.0000'))
+            self.assertEqual(production.stored_cost, production.cost)
+            output, = production.outputs
+            self.assertEqual(output.unit_price, Decimal('8.0000'))
+
+        # But not the lots of the other BOM
+        self.assertEqual(lot_cost_lines(lots[2]), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+
+        # Saving the BOM again does not change the costs
+        bom.infrastructure_cost_batch = Decimal('0')
+        bom.save()
+        self.assertEqual(lot_cost_lines(lots[0]), [
+                ('Infrastructure Cost', Decimal('2.0000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+        lots[0].reload()
+        self.assertEqual(lots[0].cost_price, Decimal('8.0000'))
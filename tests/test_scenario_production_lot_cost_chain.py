@@ -0,0 +1,114 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, lot_cost_lines, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Create two products each produced from one unit of the previous
+        ProductTemplate = Model.get('product.template')
+        BOM = Model.get('production.bom')
+        boms = [data['bom']]
+        products = [data['product']]
+        for name in ['intermediate', 'final']:
+            template = ProductTemplate()
+            template.name = name
+            template.default_uom = data['unit']
+            template.type = 'goods'
+            template.producible = True
+            template.list_price = Decimal(50)
+            template.save()
+            product, = template.products
+            bom = BOM(name=name)
+            input_ = bom.inputs.new()
+            input_.product = products[-1]
+            input_.quantity = 1
+            output = bom.outputs.new()
+            output.product = product
+            output.quantity = 1
+            bom.infrastructure_cost = Decimal(1)
+            bom.save()
+            boms.append(bom)
+            products.append(product)
+
+        # Produce each product from the lot of the previous
+        lots = []
+        for number, bom in enumerate(boms, 1):
+            lot = Lot(number=str(number), product=bom.outputs[0].product)
+            lot.save()
+            production = create_production(bom, 2, lot=lot)
+            if lots:
+                for input_ in production.inputs:
+                    input_.lot = lots[-1]
+                production.save()
+            do_production(production)
+            lots.append(lot)
+        self.assertEqual(lot_cost_lines(lots[0]), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+
+        # Changing the cost of the first lot revalues the lots produced from
+        # it
+        bom = boms[0]
+        bom.infrastructure_cost = Decimal(2)
+        bom.save()
+        self.assertEqual(lot_cost_lines(lots[0]), [
+                ('Infrastructure Cost', Decimal('2.0000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+        self.assertEqual(lot_cost_lines(lots[1]), [
+                ('Infrastructure Cost', Decimal('1.0000')),
+                ('Inputs Cost', Decimal('8.0000')),
+                ])
+        self.assertEqual(lot_cost_lines(lots[2]), [
+                ('Infrastructure Cost', Decimal('1.0000')),
+                ('Inputs Cost', Decimal('9.0000')),
+                ])
+
+        # Changing the cost of an intermediate lot revalues only the next
+        bom = boms[1]
+        bom.infrastructure_cost = Decimal(3)
+        bom.save()
+        self.assertEqual(lot_cost_lines(lots[0]), [
+                ('Infrastructure Cost', Decimal('2.0000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+        self.assertEqual(lot_cost_lines(lots[1]), [
+                ('Infrastructure Cost', Decimal('3.0000')),
+                ('Inputs Cost', Decimal('8.0000')),
+                ])
+        self.assertEqual(lot_cost_lines(lots[2]), [
+                ('Infrastructure Cost', Decimal('1.0000')),
+                ('Inputs Cost', Decimal('11.0000')),
+                ])
@@ -0,0 +1,86 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, lot_cost_lines, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Produce three lots
+        lots = []
+        for number in ['1', '2', '3']:
+            lot = Lot(number=number, product=data['product'])
+            lot.save()
+            production = create_production(data['bom'], 2, lot=lot)
+            do_production(production)
+            lots.append(lot)
+
+        # Change the cost of a lot by hand
+        line, = [l for l in lots[1].cost_lines
+            if l.category.name == 'Inputs Cost']
+        line.unit_price = Decimal(5)
+        line.save()
+
+        # Check the lot costs by chunks without repair
+        Check = Model.get('production.lot_cost.check')
+        check = Check(size=2)
+        check.click('run')
+        check.reload()
+        self.assertEqual(check.state, 'done')
+        self.assertEqual(check.productions, 3)
+        self.assertEqual(check.mismatches, 1)
+        self.assertIn('does not match the cost (6.5000)', check.report)
+        self.assertIn('of the lot (2', check.report)
+        self.assertEqual(lot_cost_lines(lots[1]), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('5.0000')),
+                ])
+
+        # Check and repair the lot costs
+        check = Check(size=2, repair=True)
+        check.click('run')
+        check.reload()
+        self.assertEqual(check.state, 'done')
+        self.assertEqual(check.mismatches, 1)
+        self.assertEqual(lot_cost_lines(lots[1]), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+
+        # The repaired costs match
+        check = Check(size=2)
+        check.click('run')
+        check.reload()
+        self.assertEqual(check.state, 'done')
+        self.assertEqual(check.productions, 3)
+        self.assertEqual(check.mismatches, 0)
+        self.assertEqual(check.report, None)
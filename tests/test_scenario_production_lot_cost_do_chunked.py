@@ -0,0 +1,70 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model, Wizard
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Copy the BOM to allocate by weight which fails without weight
+        bom, = data['bom'].duplicate()
+        bom.cost_allocation = 'weight'
+        bom.save()
+
+        # Run productions
+        productions = []
+        for i, bom in enumerate([data['bom'], data['bom'], bom]):
+            lot = Lot(number=str(i), product=data['product'])
+            lot.save()
+            production = create_production(bom, 2, lot=lot)
+            production.click('wait')
+            production.click('assign_try')
+            production.click('run')
+            productions.append(production)
+
+        # Do the productions by chunks of 2
+        do_chunked = Wizard('production.do_chunked', productions)
+        self.assertEqual(do_chunked.form.productions, 3)
+        do_chunked.form.size = 2
+        do_chunked.execute('do_')
+        first, second = do_chunked.form.report.splitlines()
+        self.assertEqual(first, "Chunk 1: 2 productions done.")
+        self.assertTrue(second.startswith("Chunk 2: 1 productions failed: "))
+        self.assertIn("must have a weight", second)
+        do_chunked.execute('end')
+
+        for production in productions:
+            production.reload()
+        self.assertEqual(
+            [p.state for p in productions], ['done', 'done', 'running'])
+        self.assertEqual(productions[0].outputs[0].lot.cost_price,
+            Decimal('7.5000'))
@@ -0,0 +1,73 @@
+import datetime as dt
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, lot_cost_lines, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Add a cost per hour to the BOM
+        bom = data['bom']
+        bom.infrastructure_cost_hour = Decimal(4)
+        bom.save()
+
+        # Produce a lot in one hour and a half
+        lot1 = Lot(number='1', product=data['product'])
+        lot1.save()
+        production1 = create_production(
+            bom, 2, lot=lot1, duration=dt.timedelta(minutes=90))
+        self.assertEqual(production1.cost, Decimal('21.0000'))
+        self.assertEqual(production1.stored_cost, production1.cost)
+
+        # Changing the duration changes the cost
+        production1.duration = dt.timedelta(hours=2)
+        production1.save()
+        self.assertEqual(production1.cost, Decimal('23.0000'))
+        self.assertEqual(production1.stored_cost, production1.cost)
+        do_production(production1)
+        self.assertEqual(lot_cost_lines(lot1), [
+                ('Infrastructure Cost', Decimal('5.5000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+
+        # Produce a lot without duration
+        lot2 = Lot(number='2', product=data['product'])
+        lot2.save()
+        production2 = create_production(bom, 2, lot=lot2)
+        self.assertEqual(production2.duration, None)
+        self.assertEqual(production2.cost, Decimal('15.0000'))
+        do_production(production2)
+        self.assertEqual(lot_cost_lines(lot2), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
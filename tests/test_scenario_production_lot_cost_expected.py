@@ -0,0 +1,72 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # The expected cost of a new production is computed from the BOM
+        Production = Model.get('production')
+        production = Production()
+        production.product = data['product']
+        production.bom = data['bom']
+        production.quantity = 2
+        production.inputs.clear()
+        production.save()
+        self.assertEqual(production.expected_lot_unit_cost, Decimal('7.5000'))
+
+        # Then from the inputs
+        lot = Lot(number='1', product=data['product'])
+        lot.save()
+        production = create_production(data['bom'], 2, lot=lot)
+        self.assertEqual(production.expected_lot_unit_cost, Decimal('7.5000'))
+        input_ = production.inputs.new()
+        input_.product = data['component']
+        input_.unit = data['unit']
+        input_.quantity = 10
+        input_.from_location = production.warehouse.storage_location
+        input_.to_location = production.location
+        production.save()
+        self.assertEqual(
+            production.expected_lot_unit_cost, Decimal('17.5000'))
+
+        # Except the cancelled inputs
+        input_, = [i for i in production.inputs if i.quantity == 10]
+        input_.click('cancel')
+        production.reload()
+        self.assertEqual(production.expected_lot_unit_cost, Decimal('7.5000'))
+
+        # The lot cost is known once the production is done
+        do_production(production)
+        self.assertEqual(production.expected_lot_unit_cost, None)
+        self.assertEqual(lot.cost_price, Decimal('7.5000'))
@@ -0,0 +1,68 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Produce two lots and run the production of a third
+        productions = []
+        for number in ['1', '2', '3']:
+            lot = Lot(number=number, product=data['product'])
+            lot.save()
+            production = create_production(data['bom'], 2, lot=lot)
+            productions.append(production)
+        do_production(productions[0])
+        do_production(productions[1])
+        running = productions[2]
+        running.click('wait')
+        running.click('assign_try')
+        running.click('run')
+
+        # Create a lot which is not produced
+        lot = Lot(number='4', product=data['product'])
+        lot.save()
+
+        # The lots show the production and the breakdown of their cost
+        lots = Lot.find([], order=[('number', 'ASC')])
+        self.assertEqual(
+            [(l.number, l.production, l.inputs_cost, l.infrastructure_cost)
+                for l in lots], [
+                ('1', productions[0], Decimal('6.0000'), Decimal('1.5000')),
+                ('2', productions[1], Decimal('6.0000'), Decimal('1.5000')),
+                ('3', None, None, None),
+                ('4', None, None, None),
+                ])
+        for lot in lots[:2]:
+            self.assertEqual(
+                lot.inputs_cost + lot.infrastructure_cost, lot.cost_price)
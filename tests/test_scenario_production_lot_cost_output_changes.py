@@ -0,0 +1,131 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    add_output, create_production, do_production, lot_cost_lines,
+    setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+        gram, kilogram = data['gram'], data['kilogram']
+
+        # Copy the BOM with a cost per batch allocated by quantity
+        batch_bom, = data['bom'].duplicate()
+        batch_bom.infrastructure_cost_batch = Decimal(10)
+        batch_bom.cost_allocation = 'quantity'
+        batch_bom.save()
+
+        def check_cost(production):
+            production.reload()
+            self.assertEqual(production.stored_cost, production.cost)
+            return production.cost
+
+        def change_outputs(bom):
+            lot1 = Lot(number='%s-1' % bom.id, product=data['product'])
+            lot1.save()
+            lot2 = Lot(number='%s-2' % bom.id, product=data['product'])
+            lot2.save()
+            production = create_production(bom, 2, lot=lot1)
+            production.click('wait')
+            costs = [check_cost(production)]
+
+            # Add an output
+            add_output(production, 500, gram, lot=lot1)
+            costs.append(check_cost(production))
+            output, = [o for o in production.outputs if o.unit == gram]
+
+            # Change its quantity
+            output.quantity = 1000
+            output.save()
+            costs.append(check_cost(production))
+
+            # Remove its lot
+            output.lot = None
+            output.save()
+            costs.append(check_cost(production))
+
+            # Set its lot
+            output.lot = lot2
+            output.save()
+            costs.append(check_cost(production))
+
+            # Cancel an output
+            add_output(production, 1, kilogram, lot=lot2)
+            costs.append(check_cost(production))
+            cancelled, = [o for o in production.outputs
+                if o.unit == kilogram and o.lot == lot2]
+            cancelled.click('cancel')
+            costs.append(check_cost(production))
+
+            # Delete an output
+            add_output(production, 1, kilogram, lot=lot2)
+            costs.append(check_cost(production))
+            deleted, = [o for o in production.outputs
+                if o.unit == kilogram and o.lot == lot2
+                and o.state != 'cancelled']
+            deleted.delete()
+            costs.append(check_cost(production))
+
+            do_production(production)
+            check_cost(production)
+            return production, costs, lot1, lot2
+
+        # Change the outputs of a production
+        production, costs, lot1, lot2 = change_outputs(data['bom'])
+        self.assertEqual(costs, [Decimal(x) for x in [
+                    '15.0000', '15.7500', '16.5000', '15.0000', '16.5000',
+                    '18.0000', '16.5000', '18.0000', '16.5000']])
+        self.assertEqual(lot_cost_lines(lot1), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('4.0000')),
+                ])
+        self.assertEqual(lot_cost_lines(lot2), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('4.0000')),
+                ])
+
+        # Change the outputs of a production with a cost per batch
+        production, costs, lot1, lot2 = change_outputs(batch_bom)
+        self.assertEqual(costs, [Decimal(x) for x in [
+                    '25.0000', '25.7500', '26.5000', '25.0000', '26.5000',
+                    '28.0000', '26.5000', '28.0000', '26.5000']])
+        self.assertEqual(
+            sorted((o.unit.name, o.unit_price) for o in production.outputs
+                if o.state == 'done'),
+            [('Gram', Decimal('0.0088')), ('Kilogram', Decimal('8.8333'))])
+        self.assertEqual(lot_cost_lines(lot1), [
+                ('Infrastructure Cost', Decimal('4.8333')),
+                ('Inputs Cost', Decimal('4.0000')),
+                ])
+        self.assertEqual(lot_cost_lines(lot2), [
+                ('Infrastructure Cost', Decimal('4.8333')),
+                ('Inputs Cost', Decimal('3.9667')),
+                ])
@@ -0,0 +1,72 @@
+import datetime as dt
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company, get_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        today = dt.date.today()
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+        company = get_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Produce a lot in the past
+        lot = Lot(number='1', product=data['product'])
+        lot.save()
+        date = today - dt.timedelta(days=10)
+        production = create_production(
+            data['bom'], 2, lot=lot, planned_date=date, effective_date=date)
+        do_production(production)
+        self.assertEqual(lot.cost_price, Decimal('7.5000'))
+
+        # Close a period after the production
+        Period = Model.get('stock.period')
+        period = Period(date=today - dt.timedelta(days=5), company=company)
+        period.save()
+        period.click('close')
+        self.assertEqual(period.state, 'closed')
+        lot_cost, = period.lot_costs
+        self.assertEqual(lot_cost.lot, lot)
+        self.assertEqual(lot_cost.production, production)
+        self.assertEqual(lot_cost.internal_quantity, 2)
+        self.assertEqual(lot_cost.inputs_cost, Decimal('6.0000'))
+        self.assertEqual(lot_cost.infrastructure_cost, Decimal('1.5000'))
+        self.assertEqual(lot_cost.unit_cost, Decimal('7.5000'))
+
+        # Reopening the period removes the lot costs
+        period.click('draft')
+        self.assertEqual(period.state, 'draft')
+        self.assertEqual(len(period.lot_costs), 0)
+
+        # And closing it again freezes them again
+        period.click('close')
+        self.assertEqual(len(period.lot_costs), 1)
@@ -0,0 +1,86 @@
+import datetime as dt
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company, get_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, lot_cost_lines, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        today = dt.date.today()
+        yesterday = today - dt.timedelta(days=1)
+        planned_date = today - dt.timedelta(days=20)
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+        company = get_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production()
+        Lot = data['Lot']
+
+        # Add a rate to the BOM which changes yesterday
+        bom = data['bom']
+        rate = bom.infrastructure_rates.new()
+        rate.currency = company.currency
+        rate.infrastructure_cost = Decimal('1')
+        rate = bom.infrastructure_rates.new()
+        rate.currency = company.currency
+        rate.start_date = yesterday
+        rate.infrastructure_cost = Decimal('5')
+        bom.save()
+
+        # A production planned before the change uses the old rate
+        lot = Lot(number='1', product=data['product'])
+        lot.save()
+        production = create_production(bom, 2, lot=lot,
+            planned_date=planned_date, planned_start_date=planned_date)
+        self.assertEqual(production.cost, Decimal('14.0000'))
+        self.assertEqual(production.stored_cost, production.cost)
+
+        # But it is done today with the new rate
+        do_production(production)
+        production.reload()
+        self.assertEqual(production.effective_date, today)
+        self.assertEqual(production.cost, Decimal('22.0000'))
+        self.assertEqual(production.stored_cost, production.cost)
+        output, = production.outputs
+        self.assertEqual(output.unit_price, Decimal('11.0000'))
+        self.assertEqual(lot_cost_lines(lot), [
+                ('Infrastructure Cost', Decimal('5.0000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+
+        # Moving the planned date of a production changes its rate
+        lot = Lot(number='2', product=data['product'])
+        lot.save()
+        production = create_production(bom, 2, lot=lot,
+            planned_date=planned_date, planned_start_date=planned_date)
+        self.assertEqual(production.stored_cost, Decimal('14.0000'))
+        production.planned_date = today
+        production.planned_start_date = today
+        production.save()
+        self.assertEqual(production.cost, Decimal('22.0000'))
+        self.assertEqual(production.stored_cost, production.cost)
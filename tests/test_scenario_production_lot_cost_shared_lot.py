@@ -0,0 +1,57 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    add_output, create_production, do_production, lot_cost_lines,
+    setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Produce 2 kg and 250 g in the same lot
+        lot = Lot(number='1', product=data['product'])
+        lot.save()
+        production = create_production(data['bom'], 2, lot=lot)
+        add_output(production, 250, data['gram'], lot=lot)
+        do_production(production)
+        self.assertEqual(production.state, 'done')
+        self.assertEqual(production.cost, Decimal('15.3750'))
+        self.assertEqual(
+            sorted((o.unit.name, o.unit_price) for o in production.outputs),
+            [('Gram', Decimal('0.0068')), ('Kilogram', Decimal('6.8333'))])
+
+        # The lot has a single pair of lines weighted by the quantities
+        self.assertEqual(lot_cost_lines(lot), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('5.3296')),
+                ])
+        self.assertEqual(lot.cost_price, Decimal('6.8296'))
+
@@ -0,0 +1,73 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+        Production = Model.get('production')
+
+        # A production without moves stores a cost of 0
+        empty = Production()
+        empty.save()
+        self.assertEqual(empty.cost, Decimal(0))
+        self.assertEqual(empty.stored_cost, Decimal(0))
+        self.assertEqual(Production.find([('cost', '=', 0)]), [empty])
+        self.assertEqual(Production.find([('cost', '=', None)]), [])
+
+        # The cost is stored when the moves are created
+        production = create_production(data['bom'], 2)
+        self.assertEqual(production.cost, Decimal('12.0000'))
+        self.assertEqual(
+            Production.find([('cost', '=', production.cost)]), [production])
+
+        # And updated when the lot of the outputs changes
+        lot = Lot(number='1', product=data['product'])
+        lot.save()
+        output, = production.outputs
+        output.lot = lot
+        production.save()
+        self.assertEqual(production.cost, Decimal('15.0000'))
+        self.assertEqual(
+            Production.find([('cost', '>', 12)]), [production])
+
+        # Or when the quantity changes
+        production.quantity = 3
+        production.save()
+        self.assertEqual(production.cost, Decimal('18.0000'))
+        self.assertEqual(
+            Production.find([('cost', '=', production.cost)]), [production])
+
+        # The productions are ordered by cost
+        self.assertEqual(
+            Production.find([], order=[('cost', 'DESC')]),
+            [production, empty])
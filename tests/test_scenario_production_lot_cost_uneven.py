@@ -0,0 +1,79 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.exceptions import UserWarning
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    add_output, create_production, lot_cost_lines, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Create a lot with a cost from elsewhere
+        Category = Model.get('stock.lot.cost_category')
+        category = Category(name="Transport")
+        category.save()
+        lot = Lot(number='1', product=data['product'])
+        line = lot.cost_lines.new()
+        line.category = category
+        line.unit_price = Decimal(1)
+        lot.save()
+
+        # Run a production with two outputs in the lot
+        production = create_production(data['bom'], 2, lot=lot)
+        add_output(production, 500, data['gram'], lot=lot)
+        production.click('wait')
+        production.click('assign_try')
+        production.click('run')
+
+        # Doing the production warns about all the outputs of the lot
+        with self.assertRaises(UserWarning) as cm:
+            production.click('do')
+        warning = cm.exception
+        lines = warning.message.splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('2.00', lines[0])
+        self.assertIn('500.00', lines[1])
+        for line in lines:
+            self.assertIn(
+                'does not match the cost (7.3000) of the lot (1)', line)
+        production.reload()
+        self.assertEqual(production.state, 'running')
+
+        # Skipping the warning does the production
+        Warning = Model.get('res.user.warning')
+        Warning(user=config.user, name=warning.name).save()
+        production.click('do')
+        self.assertEqual(production.state, 'done')
+        self.assertEqual(lot_cost_lines(lot), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('4.8000')),
+                ('Transport', Decimal('1')),
+                ])
@@ -0,0 +1,86 @@
+import unittest
+from decimal import Decimal
+
+from proteus import Model
+from trytond.modules.company.tests.tools import create_company
+from trytond.modules.production_lot_cost.tests.tools import (
+    add_output, create_production, lot_cost_lines, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+        gram = data['gram']
+
+        # Produce in grams a product in kilograms
+        Production = Model.get('production')
+        lot1 = Lot(number='1', product=data['product'])
+        lot1.save()
+        production1 = Production()
+        production1.product = data['product']
+        production1.bom = data['bom']
+        production1.unit = gram
+        production1.quantity = 2000
+        output, = production1.outputs
+        output.unit = gram
+        output.quantity = 2000
+        output.lot = lot1
+        production1.save()
+        self.assertEqual(
+            production1.expected_lot_unit_cost, Decimal('7.5000'))
+
+        # And in kilograms with an output in grams
+        lot2 = Lot(number='2', product=data['product'])
+        lot2.save()
+        production2 = create_production(data['bom'], 2, lot=lot2)
+        add_output(production2, 500, gram, lot=lot2)
+
+        # Do the productions together
+        productions = [production1, production2]
+        Production.click(productions, 'wait')
+        Production.click(productions, 'assign_try')
+        Production.click(productions, 'run')
+        Production.click(productions, 'do')
+        for production in productions:
+            production.reload()
+            self.assertEqual(production.state, 'done')
+            self.assertEqual(production.stored_cost, production.cost)
+        self.assertEqual(production1.cost, Decimal('15.0000'))
+        output, = production1.outputs
+        self.assertEqual(output.unit_price, Decimal('0.0075'))
+        self.assertEqual(lot_cost_lines(lot1), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('6.0000')),
+                ])
+        self.assertEqual(production2.cost, Decimal('15.7500'))
+        self.assertEqual(
+            sorted((o.unit.name, o.unit_price) for o in production2.outputs),
+            [('Gram', Decimal('0.0063')), ('Kilogram', Decimal('6.3000'))])
+        self.assertEqual(lot_cost_lines(lot2), [
+                ('Infrastructure Cost', Decimal('1.5000')),
+                ('Inputs Cost', Decimal('4.8000')),
+                ])
@@ -0,0 +1,104 @@
+import datetime as dt
+import unittest
+from decimal import Decimal
+
+from proteus import Model, Wizard
+from trytond.modules.company.tests.tools import create_company, get_company
+from trytond.modules.currency.tests.tools import get_currency
+from trytond.modules.production_lot_cost.tests.tools import (
+    create_production, do_production, setup_production)
+from trytond.tests.test_tryton import drop_db
+from trytond.tests.tools import activate_modules
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        drop_db()
+        super().setUp()
+
+    def tearDown(self):
+        drop_db()
+        super().tearDown()
+
+    def test(self):
+
+        today = dt.date.today()
+
+        # Activate production_lot_cost
+        config = activate_modules('production_lot_cost')
+
+        # Create company
+        _ = create_company()
+        company = get_company()
+
+        # Reload the context
+        User = Model.get('res.user')
+        config._context = User.get_preferences(True, config.context)
+
+        # Create product, BOM and stock
+        data = setup_production(infrastructure_cost=Decimal('1.5'))
+        Lot = data['Lot']
+
+        # Produce two lots
+        for number, quantity in [('1', 2), ('2', 3)]:
+            lot = Lot(number=number, product=data['product'])
+            lot.save()
+            production = create_production(data['bom'], quantity, lot=lot)
+            do_production(production)
+
+        # The costs match the standard costs
+        Variance = Model.get('production.lot_cost.variance')
+        with config.set_context(
+                company=company.id, from_date=today, to_date=today):
+            variance, = Variance.find([])
+        self.assertEqual(variance.bom, data['bom'])
+        self.assertEqual(variance.product, data['product'])
+        self.assertEqual(variance.productions, 2)
+        self.assertEqual(variance.quantity, 5)
+        self.assertEqual(variance.standard_inputs_cost, Decimal('30.0000'))
+        self.assertEqual(variance.actual_inputs_cost, Decimal('30.0000'))
+        self.assertEqual(variance.inputs_variance, Decimal('0.0000'))
+        self.assertEqual(
+            variance.standard_infrastructure_cost, Decimal('7.5000'))
+        self.assertEqual(
+            variance.actual_infrastructure_cost, Decimal('7.5000'))
+        self.assertEqual(variance.infrastructure_variance, Decimal('0.0000'))
+
+        # The standard inputs cost follows the cost price of the component
+        modify_cost_price = Wizard(
+            'product.modify_cost_price', [data['component']])
+        modify_cost_price.form.cost_price = '3'
+        modify_cost_price.execute('modify')
+        with config.set_context(
+                company=company.id, from_date=today, to_date=today):
+            variance, = Variance.find([])
+        self.assertEqual(variance.standard_inputs_cost, Decimal('45.0000'))
+        self.assertEqual(variance.inputs_variance, Decimal('-15.0000'))
+
+        # The productions out of the dates are not compared
+        with config.set_context(company=company.id,
+                from_date=today - dt.timedelta(days=2),
+                to_date=today - dt.timedelta(days=1)):
+            self.assertEqual(Variance.find([]), [])
+
+        # The standard infrastructure cost follows the rate of the BOM
+        # converted into the company currency
+        eur = get_currency('EUR')
+        bom = data['bom']
+        rate = bom.infrastructure_rates.new()
+        rate.currency = eur
+        rate.infrastructure_cost = Decimal('4')
+        rate = bom.infrastructure_rates.new()
+        rate.currency = company.currency
+        rate.start_date = today + dt.timedelta(days=1)
+        rate.infrastructure_cost = Decimal('9')
+        bom.save()
+        with config.set_context(
+                company=company.id, from_date=today, to_date=today):
+            variance, = Variance.find([])
+        self.assertEqual(
+            variance.standard_infrastructure_cost, Decimal('10.0000'))
+        self.assertEqual(
+            variance.actual_infrastructure_cost, Decimal('10.0000'))
+        self.assertEqual(variance.infrastructure_variance, Decimal('0.0000'))
@@ -0,0 +1,133 @@
+# The COPYRIGHT file at the top level of this repository contains the full
+# copyright notices and license terms.
+from decimal import Decimal
+
+from proteus import Model
+
+__all__ = ['setup_production', 'create_production', 'add_output',
+    'do_production', 'lot_cost_lines']
+
+
+def setup_production(infrastructure_cost=None, config=None):
+    """Create a product in kilogram produced from a component by a BOM and
+    put the component in stock
+
+    Return a dictionary with the product, the component, the BOM and the
+    units, locations and lot model."""
+    Location = Model.get('stock.location', config=config)
+    ProductUom = Model.get('product.uom', config=config)
+    ProductTemplate = Model.get('product.template', config=config)
+    BOM = Model.get('production.bom', config=config)
+    BOMInput = Model.get('production.bom.input', config=config)
+    BOMOutput = Model.get('production.bom.output', config=config)
+    Inventory = Model.get('stock.inventory', config=config)
+    InventoryLine = Model.get('stock.inventory.line', config=config)
+
+    warehouse, = Location.find([('code', '=', 'WH')])
+    production_location, = Location.find([('code', '=', 'PROD')])
+    storage, = Location.find([('code', '=', 'STO')])
+    warehouse.production_location = production_location
+    warehouse.save()
+
+    unit, = ProductUom.find([('name', '=', 'Unit')])
+    kilogram, = ProductUom.find([('name', '=', 'Kilogram')])
+    gram, = ProductUom.find([('name', '=', 'Gram')])
+
+    template = ProductTemplate()
+    template.name = 'product'
+    template.default_uom = kilogram
+    template.type = 'goods'
+    template.producible = True
+    template.list_price = Decimal(30)
+    template.save()
+    product, = template.products
+
+    template = ProductTemplate()
+    template.name = 'component'
+    template.default_uom = unit
+    template.type = 'goods'
+    template.list_price = Decimal(5)
+    template.save()
+    component, = template.products
+    component.cost_price = Decimal(2)
+    component.save()
+
+    bom = BOM(name='product')
+    input_ = BOMInput()
+    bom.inputs.append(input_)
+    input_.product = component
+    input_.quantity = 3
+    output = BOMOutput()
+    bom.outputs.append(output)
+    output.product = product
+    output.quantity = 1
+    bom.infrastructure_cost = infrastructure_cost
+    bom.save()
+
+    inventory = Inventory()
+    inventory.location = storage
+    line = InventoryLine()
+    inventory.lines.append(line)
+    line.product = component
+    line.quantity = 1000
+    inventory.click('confirm')
+
+    return {
+        'product': product,
+        'component': component,
+        'bom': bom,
+        'unit': unit,
+        'kilogram': kilogram,
+        'gram': gram,
+        'warehouse': warehouse,
+        'production_location': production_location,
+        'storage': storage,
+        'Lot': Model.get('stock.lot', config=config),
+        }
+
+
+def create_production(bom, quantity, lot=None, config=None, **values):
+    """Create and return a draft production of the BOM
+
+    The outputs of the product are put in the lot if any."""
+    Production = Model.get('production', config=config)
+    product = bom.outputs[0].product
+    production = Production(**values)
+    production.product = product
+    production.bom = bom
+    production.quantity = quantity
+    production.save()
+    if lot:
+        for output in production.outputs:
+            if output.product == product:
+                output.lot = lot
+        production.save()
+    return production
+
+
+def add_output(production, quantity, unit, lot=None, product=None):
+    "Add an output of the product in the unit to the production"
+    output = production.outputs.new()
+    output.product = product or production.product
+    output.unit = unit
+    output.quantity = quantity
+    output.lot = lot
+    output.from_location = production.location
+    output.to_location = production.warehouse.storage_location
+    output.unit_price = Decimal(0)
+    output.currency = production.company.currency
+    production.save()
+
+
+def do_production(production):
+    "Make the production done"
+    production.click('wait')
+    production.click('assign_try')
+    production.click('run')
+    production.click('do')
+
+
+def lot_cost_lines(lot):
+    "Return the category names and unit prices of the cost lines of the lot"
+    lot.reload()
+    return sorted((l.category.name, l.unit_price) for l in lot.cost_lines)
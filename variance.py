@@ -0,0 +1,220 @@
+# The COPYRIGHT file at the top level of this repository contains the full
+# copyright notices and license terms.
+from dateutil.relativedelta import relativedelta
+from sql import Cast, Column, Literal, Null, With
+from sql.aggregate import Count, Min, Sum
+from sql.conditionals import Case, Coalesce
+from sql.functions import Extract, Round
+
+from trytond.model import ModelSQL, ModelView, fields
+from trytond.modules.product import price_digits
+from trytond.pool import Pool
+from trytond.pyson import Eval, If
+from trytond.transaction import Transaction
+
+
+class Variance(ModelSQL, ModelView):
+    "Production Lot Cost Variance"
+    __name__ = 'production.lot_cost.variance'
+    company = fields.Many2One('company.company', "Company")
+    bom = fields.Many2One('production.bom', "BOM")
+    product = fields.Many2One('product.product', "Product",
+        context={
+            'company': Eval('company', -1),
+            },
+        depends={'company'})
+    productions = fields.Integer("Productions")
+    quantity = fields.Float("Quantity", digits=(16, 4))
+    standard_inputs_cost = fields.Numeric(
+        "Standard Inputs Cost", digits=price_digits)
+    actual_inputs_cost = fields.Numeric(
+        "Actual Inputs Cost", digits=price_digits)
+    inputs_variance = fields.Numeric(
+        "Inputs Variance", digits=price_digits)
+    standard_infrastructure_cost = fields.Numeric(
+        "Standard Infrastructure Cost", digits=price_digits)
+    actual_infrastructure_cost = fields.Numeric(
+        "Actual Infrastructure Cost", digits=price_digits)
+    infrastructure_variance = fields.Numeric(
+        "Infrastructure Variance", digits=price_digits)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls._order.insert(0, ('product', 'ASC'))
+
+    @classmethod
+    def table_query(cls):
+        "Compare the costs of the lots produced in the context dates"
+        pool = Pool()
+        BOM = pool.get('production.bom')
+        Company = pool.get('company.company')
+        CostPrice = pool.get('product.cost_price')
+        Currency = pool.get('currency.currency')
+        Move = pool.get('stock.move')
+        Production = pool.get('production')
+        production = Production.__table__()
+        bom = BOM.__table__()
+        company = Company.__table__()
+        move = Move.__table__()
+        cost_price = CostPrice.__table__()
+        context = Transaction().context
+
+        def where(production):
+            clause = Literal(True)
+            if context.get('company'):
+                clause &= production.company == context['company']
+            if context.get('from_date'):
+                clause &= production.effective_date >= context['from_date']
+            if context.get('to_date'):
+                clause &= production.effective_date <= context['to_date']
+            return clause
+
+        # Actual costs from the cost lines of the output lots
+        query, tables = Production._lot_costs_query()
+        lot_production, lot_move = tables['production'], tables['move']
+        lot_quantity = Cast(lot_move.internal_quantity, 'NUMERIC')
+        outputs = query.select(
+            lot_production.id.as_('production'),
+            Sum(Case(
+                    (lot_move.product == lot_production.product,
+                        lot_quantity),
+                    else_=Literal(0))).as_('quantity'),
+            Sum(tables['inputs_cost'] * lot_quantity).as_('inputs_cost'),
+            Sum(tables['infrastructure_cost'] * lot_quantity).as_(
+                'infrastructure_cost'),
+            where=where(lot_production),
+            group_by=[lot_production.id])
+
+        # Standard inputs cost from the cost price of the consumed products
+        inputs = (move
+            .join(production,
+                condition=move.production_input == production.id)
+            .join(cost_price, 'LEFT',
+                condition=(cost_price.product == move.product)
+                & (cost_price.company == production.company))
+            .select(
+                production.id.as_('production'),
+                Sum(Cast(move.internal_quantity, 'NUMERIC')
+                    * Coalesce(cost_price.cost_price, 0)).as_('cost'),
+                where=(move.state == 'done') & (production.state == 'done')
+                & where(production),
+                group_by=[production.id]))
+
+        # Standard infrastructure cost from the BOM rate applicable to the
+        # production converted into the company currency or from the BOM
+        rates = Production._infrastructure_rates_query(where)
+        currency_rate = With(query=Currency.currency_rate_sql())
+        currency_rate_company = With(query=Currency.currency_rate_sql())
+
+        def driver(fname):
+            return Case(
+                (rates.production == Null,
+                    Coalesce(Column(bom, fname), 0)),
+                (rates.currency == company.currency,
+                    Coalesce(Column(rates, fname), 0)),
+                else_=(Coalesce(Column(rates, fname), 0)
+                    * currency_rate_company.rate / currency_rate.rate))
+
+        hours = Cast(
+            Coalesce(Extract('EPOCH', production.duration), 0),
+            'NUMERIC') / 3600
+        standard_infrastructure_cost = (
+            driver('infrastructure_cost') * outputs.quantity
+            + driver('infrastructure_cost_batch')
+            + driver('infrastructure_cost_hour') * hours)
+        standard_inputs_cost = Sum(Coalesce(inputs.cost, 0))
+        actual_inputs_cost = Sum(outputs.inputs_cost)
+        standard_infrastructure_cost = Sum(standard_infrastructure_cost)
+        actual_infrastructure_cost = Sum(outputs.infrastructure_cost)
+        digits = price_digits[1]
+
+        def round_(field, value):
+            return field.sql_cast(Round(value, digits))
+
+        return (production
+            .join(outputs, condition=outputs.production == production.id)
+            .join(inputs, 'LEFT',
+                condition=inputs.production == production.id)
+            .join(bom, 'LEFT', condition=production.bom == bom.id)
+            .join(company, condition=production.company == company.id)
+            .join(rates, 'LEFT',
+                condition=rates.production == production.id)
+            .join(currency_rate, 'LEFT',
+                condition=(currency_rate.currency == rates.currency)
+                & (currency_rate.start_date <= rates.date)
+                & ((currency_rate.end_date == Null)
+                    | (currency_rate.end_date > rates.date)))
+            .join(currency_rate_company, 'LEFT',
+                condition=(currency_rate_company.currency == company.currency)
+                & (currency_rate_company.start_date <= rates.date)
+                & ((currency_rate_company.end_date == Null)
+                    | (currency_rate_company.end_date > rates.date)))
+            .select(
+                Min(production.id).as_('id'),
+                production.company.as_('company'),
+                production.bom.as_('bom'),
+                production.product.as_('product'),
+                Count(production.id).as_('productions'),
+                cls.quantity.sql_cast(Sum(outputs.quantity)).as_('quantity'),
+                round_(cls.standard_inputs_cost, standard_inputs_cost).as_(
+                    'standard_inputs_cost'),
+                round_(cls.actual_inputs_cost, actual_inputs_cost).as_(
+                    'actual_inputs_cost'),
+                round_(cls.inputs_variance,
+                    actual_inputs_cost - standard_inputs_cost).as_(
+                    'inputs_variance'),
+                round_(cls.standard_infrastructure_cost,
+                    standard_infrastructure_cost).as_(
+                    'standard_infrastructure_cost'),
+                round_(cls.actual_infrastructure_cost,
+                    actual_infrastructure_cost).as_(
+                    'actual_infrastructure_cost'),
+                round_(cls.infrastructure_variance,
+                    actual_infrastructure_cost
+                    - standard_infrastructure_cost).as_(
+                    'infrastructure_variance'),
+                where=where(production) & (production.product != Null),
+                group_by=[
+                    production.company, production.bom, production.product],
+                with_=[currency_rate, currency_rate_company]))
+
+
+class VarianceContext(ModelView):
+    "Production Lot Cost Variance Context"
+    __name__ = 'production.lot_cost.variance.context'
+    company = fields.Many2One('company.company', "Company", required=True)
+    from_date = fields.Date("From Date",
+        domain=[
+            If(Eval('to_date') & Eval('from_date'),
+                ('from_date', '<=', Eval('to_date')),
+                ()),
+            ])
+    to_date = fields.Date("To Date",
+        domain=[
+            If(Eval('from_date') & Eval('to_date'),
+                ('to_date', '>=', Eval('from_date')),
+                ()),
+            ])
+
+    @classmethod
+    def default_company(cls):
+        return Transaction().context.get('company')
+
+    @classmethod
+    def default_from_date(cls):
+        pool = Pool()
+        Date = pool.get('ir.date')
+        context = Transaction().context
+        if 'from_date' in context:
+            return context['from_date']
+        return Date.today() - relativedelta(years=1)
+
+    @classmethod
+    def default_to_date(cls):
+        pool = Pool()
+        Date = pool.get('ir.date')
+        context = Transaction().context
+        if 'to_date' in context:
+            return context['to_date']
+        return Date.today()